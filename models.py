@@ -1,12 +1,127 @@
 import math
+from typing import Optional
+
 import numpy as np
 import torch
-from torch.nn import (ModuleList, Linear, Conv1d, MaxPool1d, Embedding, ReLU,
-                      Sequential, BatchNorm1d as BN)
+from torch import Tensor
+from torch.nn import ModuleList, Sequential, Linear, ReLU, Conv1d, MaxPool1d, EmbeddingBag, BatchNorm1d as BN
 import torch.nn.functional as F
-from torch_geometric.nn import GCNConv, SAGEConv, GINConv, global_sort_pool, global_add_pool, global_mean_pool, MLP, \
-    global_max_pool
-from torch_geometric.utils import dropout_adj
+from torch.utils.checkpoint import checkpoint
+from torch_geometric.nn import GCNConv, SAGEConv, GINConv, global_add_pool, global_mean_pool, global_max_pool
+from torch_geometric.nn.conv.gcn_conv import gcn_norm
+from torch_geometric.utils import dropout_adj, to_dense_batch
+from torch_sparse import SparseTensor
+
+
+@torch.no_grad()
+def center_pool_indices(batch):
+    # index of the first node (the src of the target link) of every graph in the batch.
+    # batch is sorted in PyG, so graph boundaries are wherever the batch vector changes value.
+    # computed on-device to avoid a blocking device to host copy every forward pass.
+    # the dst of the target link always directly follows the src, i.e. lives at index + 1.
+    boundaries = (batch[1:] != batch[:-1]).nonzero(as_tuple=False).view(-1) + 1
+    return torch.cat([batch.new_zeros(1), boundaries])
+
+
+def initial_node_features(z_emb, x=None, n_emb=None):
+    # copy [z_emb, x, n_emb] into one preallocated buffer rather than growing it with chained torch.cat calls.
+    # copy_ also takes care of casting x to float.
+    parts = [part for part in (z_emb, x, n_emb) if part is not None]
+    if len(parts) == 1:
+        return z_emb
+    out = z_emb.new_empty((z_emb.size(0), sum(part.size(1) for part in parts)))
+    offset = 0
+    for part in parts:
+        out.narrow(1, offset, part.size(1)).copy_(part)
+        offset += part.size(1)
+    return out
+
+
+def undirected_edge_keep_mask(edge_index, num_nodes, p):
+    # dropedge mask where both directions of an edge are kept or dropped together (like force_undirected=True).
+    # the unordered pair is fed through a freshly salted universal hash instead of coalescing edge_index
+    prime = 2 ** 31 - 1
+    row, col = edge_index
+    key = (torch.minimum(row, col) * num_nodes + torch.maximum(row, col)) % prime
+    a, b = torch.randint(1, prime, (2,), device=key.device)
+    return (key * a + b) % prime >= p * prime
+
+
+def sort_pool(x, batch, k):
+    # SortPooling as in global_sort_pool: per graph, the k nodes with the largest last channel in descending order,
+    # zero-padded for graphs with fewer than k nodes. A topk over the dense scores replaces the full per-graph sort
+    dense_x, mask = to_dense_batch(x, batch)  # [num_graphs, max_num_nodes, channels]
+    num_graphs, max_num_nodes, channels = dense_x.size()
+    score = dense_x[:, :, -1].masked_fill(~mask, float('-inf'))
+    _, perm = score.topk(min(k, max_num_nodes), dim=-1)
+    x = dense_x.gather(1, perm.unsqueeze(-1).expand(-1, -1, channels))
+    x = x * mask.gather(1, perm).unsqueeze(-1)
+    if max_num_nodes < k:
+        x = F.pad(x, (0, 0, 0, k - max_num_nodes))
+    return x.reshape(num_graphs, k * channels)
+
+
+def to_adj_t(edge_index, edge_weight, num_nodes):
+    # transposed CSR adjacency, built once per forward so that every conv runs a fused sparse matmul
+    # instead of the gather/scatter path it takes for a COO edge_index
+    return SparseTensor(row=edge_index[1], col=edge_index[0], value=edge_weight,
+                        sparse_sizes=(num_nodes, num_nodes))
+
+
+def conv_autocast(device, amp_dtype):
+    # mixed precision for the GNN layers only, a no-op when amp_dtype is None.
+    # on Ampere+ GPUs, torch.set_float32_matmul_precision('high') (TF32) is a cheaper alternative
+    return torch.autocast(device.type, dtype=amp_dtype, enabled=amp_dtype is not None)
+
+
+class Float32Aggregation(object):
+    # mixin for the PyG convs used below. torch_sparse's spmm has no bfloat16 kernel and needs adj_t's values and
+    # the features in one dtype, so the sparse aggregation always runs in float32 with autocast turned off, while
+    # the Linear layers of the convs still run in amp_dtype under conv_autocast
+    def message_and_aggregate(self, adj_t, x):
+        with torch.autocast(adj_t.device().type, enabled=False):
+            if isinstance(x, tuple):
+                x = tuple(part.float() if part is not None else None for part in x)
+            else:
+                x = x.float()
+            return super(Float32Aggregation, self).message_and_aggregate(adj_t, x)
+
+
+class AmpGCNConv(Float32Aggregation, GCNConv):
+    pass
+
+
+class AmpSAGEConv(Float32Aggregation, SAGEConv):
+    pass
+
+
+class AmpGINConv(Float32Aggregation, GINConv):
+    pass
+
+
+def maybe_checkpoint(enabled, function, *args):
+    # when enabled, the activations of function are recomputed during backward instead of being stored
+    if enabled:
+        return checkpoint(function, *args, use_reentrant=False)
+    return function(*args)
+
+
+class TinyMLP(torch.nn.Module):
+    # Linear -> ReLU -> Dropout -> Linear scoring head shared by all models. Same computation (and parameter names)
+    # as torch_geometric's MLP([in, hidden, 1], batch_norm=False) without its generic per-layer dispatch
+    def __init__(self, in_channels, hidden_channels, dropout=0.5):
+        super(TinyMLP, self).__init__()
+        self.lins = ModuleList([Linear(in_channels, hidden_channels), Linear(hidden_channels, 1)])
+        self.dropout = dropout
+
+    def reset_parameters(self):
+        for lin in self.lins:
+            lin.reset_parameters()
+
+    def forward(self, x):
+        x = F.relu(self.lins[0](x), inplace=True)
+        x = F.dropout(x, p=self.dropout, training=self.training)
+        return self.lins[1](x)
 
 
 class GCN(torch.nn.Module):
@@ -16,53 +131,79 @@ class GCN(torch.nn.Module):
 
         self.use_feature = use_feature
         self.node_embedding = node_embedding
+        # resolved once here so forward does not need to re-inspect the modules on every step
+        self.use_node_embedding = node_embedding is not None
         self.max_z = max_z
-        self.z_embedding = Embedding(self.max_z, hidden_channels)
+        self.z_embedding = EmbeddingBag(self.max_z, hidden_channels, mode='sum')
 
         self.convs = ModuleList()
         initial_channels = hidden_channels
         if self.use_feature:
             initial_channels += train_dataset.num_features
-        if self.node_embedding is not None:
+        if self.use_node_embedding:
             initial_channels += node_embedding.embedding_dim
-        self.convs.append(GCNConv(initial_channels, hidden_channels))
+        # the normalized adjacency is the same for every layer, so it is computed once in forward
+        self.convs.append(AmpGCNConv(initial_channels, hidden_channels, normalize=False))
         for _ in range(num_layers - 1):
-            self.convs.append(GCNConv(hidden_channels, hidden_channels))
+            self.convs.append(AmpGCNConv(hidden_channels, hidden_channels, normalize=False))
 
         self.dropout = dropout
         self.dropedge = dropedge
-        self.mlp = MLP([hidden_channels, hidden_channels, 1], dropout=dropout, batch_norm=False)
+        self.conv_checkpointing = False
+        self.amp_dtype = None
+        self.mlp = TinyMLP(hidden_channels, hidden_channels, dropout=dropout)
 
     def reset_parameters(self):
+        # the node embedding is left alone, it can be pretrained and is re-initialized by the caller when trained
+        self.z_embedding.reset_parameters()
         for conv in self.convs:
             conv.reset_parameters()
-
-    def forward(self, num_nodes, z, edge_index, batch, x=None, edge_weight=None, node_id=None):
-        edge_index, _ = dropout_adj(edge_index, p=self.dropedge,
-                                    force_undirected=True,
-                                    num_nodes=num_nodes,
-                                    training=self.training)
-
-        z_emb = self.z_embedding(z)
-        if z_emb.ndim == 3:  # in case z has multiple integer labels
-            z_emb = z_emb.sum(dim=1)
-        if self.use_feature and x is not None:
-            x = torch.cat([z_emb, x.to(torch.float)], 1)
-        else:
-            x = z_emb
-        if self.node_embedding is not None and node_id is not None:
-            n_emb = self.node_embedding(node_id)
-            x = torch.cat([x, n_emb], 1)
-        for conv in self.convs[:-1]:
-            x = conv(x, edge_index, edge_weight)
-            x = F.relu(x)
-            x = F.dropout(x, p=self.dropout, training=self.training)
-        x = self.convs[-1](x, edge_index, edge_weight)
+        self.mlp.reset_parameters()
+
+    def enable_conv_checkpointing(self):
+        self.conv_checkpointing = True
+
+    def compile_forward(self, dynamic=True, mode='default'):
+        # compile the forward pass with TorchInductor; dynamic shapes as every batch has a different number of nodes.
+        # not named compile, which is nn.Module.compile in torch 2.x with a different contract
+        self.forward = torch.compile(self.forward, dynamic=dynamic, mode=mode)
+        return self
+
+    def conv_block(self, conv, x, adj_t):
+        x = conv(x, adj_t)
+        # the conv output is not needed for backward, so relu can overwrite it. dropout has to stay out-of-place
+        # since relu's backward reads its output
+        x = F.relu(x, inplace=True)
+        return F.dropout(x, p=self.dropout, training=self.training)
+
+    def forward(self, num_nodes: int, z: Tensor, edge_index: Tensor, batch: Tensor, x: Optional[Tensor] = None,
+                edge_weight: Optional[Tensor] = None, node_id: Optional[Tensor] = None):
+        training = self.training
+        if training and self.dropedge > 0:
+            # a dropped edge is an edge with zero weight, which saves rebuilding and coalescing edge_index
+            keep = undirected_edge_keep_mask(edge_index, num_nodes, self.dropedge)
+            edge_weight = keep.to(torch.float) if edge_weight is None else edge_weight * keep
+
+        # in case z has multiple integer labels, each row of z is one bag and its label embeddings are summed
+        z_emb = self.z_embedding(z.view(z.size(0), -1))
+        x = x if self.use_feature else None
+        n_emb = self.node_embedding(node_id) if self.use_node_embedding and node_id is not None else None
+        x = initial_node_features(z_emb, x, n_emb)
+        edge_index, edge_weight = gcn_norm(edge_index, edge_weight, x.size(0), add_self_loops=True, dtype=x.dtype)
+        adj_t = to_adj_t(edge_index, edge_weight, x.size(0))
+        checkpointing = self.conv_checkpointing and training
+        with conv_autocast(x.device, self.amp_dtype):
+            # unpacking gives a plain list, slicing the ModuleList would build a new ModuleList every forward
+            *inner_convs, last_conv = self.convs
+            for conv in inner_convs:
+                x = maybe_checkpoint(checkpointing, self.conv_block, conv, x, adj_t)
+            x = last_conv(x, adj_t)
+        x = x.float()
 
         # center pooling
-        _, center_indices = np.unique(batch.cpu().numpy(), return_index=True)
-        x_src = x[center_indices]
-        x_dst = x[center_indices + 1]
+        center_indices = center_pool_indices(batch)
+        pair_indices = torch.stack([center_indices, center_indices + 1]).view(-1)
+        x_src, x_dst = x.index_select(0, pair_indices).view(2, -1, x.size(1))
         x = (x_src * x_dst)
 
         # sum pool
@@ -81,51 +222,76 @@ class SAGE(torch.nn.Module):
         super(SAGE, self).__init__()
         self.use_feature = use_feature
         self.node_embedding = node_embedding
+        # resolved once here so forward does not need to re-inspect the modules on every step
+        self.use_node_embedding = node_embedding is not None
         self.max_z = max_z
-        self.z_embedding = Embedding(self.max_z, hidden_channels)
+        self.z_embedding = EmbeddingBag(self.max_z, hidden_channels, mode='sum')
 
         self.convs = ModuleList()
         initial_channels = hidden_channels
         if self.use_feature:
             initial_channels += train_dataset.num_features
-        if self.node_embedding is not None:
+        if self.use_node_embedding:
             initial_channels += node_embedding.embedding_dim
-        self.convs.append(SAGEConv(initial_channels, hidden_channels))
+        self.convs.append(AmpSAGEConv(initial_channels, hidden_channels))
         for _ in range(num_layers - 1):
-            self.convs.append(SAGEConv(hidden_channels, hidden_channels))
+            self.convs.append(AmpSAGEConv(hidden_channels, hidden_channels))
 
         self.dropout = dropout
         self.dropedge = dropedge
-        self.mlp = MLP([hidden_channels, hidden_channels, 1], dropout=dropout, batch_norm=False)
+        self.conv_checkpointing = False
+        self.amp_dtype = None
+        self.mlp = TinyMLP(hidden_channels, hidden_channels, dropout=dropout)
 
     def reset_parameters(self):
+        # the node embedding is left alone, it can be pretrained and is re-initialized by the caller when trained
+        self.z_embedding.reset_parameters()
         for conv in self.convs:
             conv.reset_parameters()
-
-    def forward(self, num_nodes, z, edge_index, batch, x=None, edge_weight=None, node_id=None):
-        edge_index, _ = dropout_adj(edge_index, p=self.dropedge,
-                                    force_undirected=True,
-                                    num_nodes=num_nodes,
-                                    training=self.training)
-        z_emb = self.z_embedding(z)
-        if z_emb.ndim == 3:  # in case z has multiple integer labels
-            z_emb = z_emb.sum(dim=1)
-        if self.use_feature and x is not None:
-            x = torch.cat([z_emb, x.to(torch.float)], 1)
-        else:
-            x = z_emb
-        if self.node_embedding is not None and node_id is not None:
-            n_emb = self.node_embedding(node_id)
-            x = torch.cat([x, n_emb], 1)
-        for conv in self.convs[:-1]:
-            x = conv(x, edge_index)
-            x = F.relu(x)
-            x = F.dropout(x, p=self.dropout, training=self.training)
-        x = self.convs[-1](x, edge_index)
+        self.mlp.reset_parameters()
+
+    def enable_conv_checkpointing(self):
+        self.conv_checkpointing = True
+
+    def compile_forward(self, dynamic=True, mode='default'):
+        # compile the forward pass with TorchInductor; dynamic shapes as every batch has a different number of nodes.
+        # not named compile, which is nn.Module.compile in torch 2.x with a different contract
+        self.forward = torch.compile(self.forward, dynamic=dynamic, mode=mode)
+        return self
+
+    def conv_block(self, conv, x, adj_t):
+        x = conv(x, adj_t)
+        # the conv output is not needed for backward, so relu can overwrite it. dropout has to stay out-of-place
+        # since relu's backward reads its output
+        x = F.relu(x, inplace=True)
+        return F.dropout(x, p=self.dropout, training=self.training)
+
+    def forward(self, num_nodes: int, z: Tensor, edge_index: Tensor, batch: Tensor, x: Optional[Tensor] = None,
+                edge_weight: Optional[Tensor] = None, node_id: Optional[Tensor] = None):
+        training = self.training
+        if training and self.dropedge > 0:
+            edge_index, _ = dropout_adj(edge_index, p=self.dropedge,
+                                        force_undirected=True,
+                                        num_nodes=num_nodes,
+                                        training=training)
+        # in case z has multiple integer labels, each row of z is one bag and its label embeddings are summed
+        z_emb = self.z_embedding(z.view(z.size(0), -1))
+        x = x if self.use_feature else None
+        n_emb = self.node_embedding(node_id) if self.use_node_embedding and node_id is not None else None
+        x = initial_node_features(z_emb, x, n_emb)
+        adj_t = to_adj_t(edge_index, None, x.size(0))
+        checkpointing = self.conv_checkpointing and training
+        with conv_autocast(x.device, self.amp_dtype):
+            # unpacking gives a plain list, slicing the ModuleList would build a new ModuleList every forward
+            *inner_convs, last_conv = self.convs
+            for conv in inner_convs:
+                x = maybe_checkpoint(checkpointing, self.conv_block, conv, x, adj_t)
+            x = last_conv(x, adj_t)
+        x = x.float()
         if True:  # center pooling
-            _, center_indices = np.unique(batch.cpu().numpy(), return_index=True)
-            x_src = x[center_indices]
-            x_dst = x[center_indices + 1]
+            center_indices = center_pool_indices(batch)
+            pair_indices = torch.stack([center_indices, center_indices + 1]).view(-1)
+            x_src, x_dst = x.index_select(0, pair_indices).view(2, -1, x.size(1))
             x = (x_src * x_dst)
             x = self.mlp(x)
         else:  # max pooling
@@ -138,12 +304,14 @@ class SAGE(torch.nn.Module):
 # An end-to-end deep learning architecture for graph classification, AAAI-18.
 class DGCNN(torch.nn.Module):
     def __init__(self, hidden_channels, num_layers, max_z, k=0.6, train_dataset=None,
-                 dynamic_train=False, GNN=GCNConv, use_feature=False,
+                 dynamic_train=False, GNN=AmpGCNConv, use_feature=False,
                  node_embedding=None, dropedge=0.0):
         super(DGCNN, self).__init__()
 
         self.use_feature = use_feature
         self.node_embedding = node_embedding
+        # resolved once here so forward does not need to re-inspect the modules on every step
+        self.use_node_embedding = node_embedding is not None
 
         if k <= 1:  # Transform percentile to number.
             if train_dataset is None:
@@ -153,19 +321,21 @@ class DGCNN(torch.nn.Module):
                     sampled_train = train_dataset[:1000]
                 else:
                     sampled_train = train_dataset
-                num_nodes = sorted([g.num_nodes for g in sampled_train])
-                k = num_nodes[int(math.ceil(k * len(num_nodes))) - 1]
-                k = max(10, k)
+                # only the k-th order statistic is needed, so partition (O(N)) instead of a full sort
+                num_nodes = np.fromiter((g.num_nodes for g in sampled_train), dtype=np.int64)
+                kth = int(math.ceil(k * num_nodes.size)) - 1
+                k = np.partition(num_nodes, kth)[kth]
+                k = max(10, int(k))
         self.k = int(k)
 
         self.max_z = max_z
-        self.z_embedding = Embedding(self.max_z, hidden_channels)
+        self.z_embedding = EmbeddingBag(self.max_z, hidden_channels, mode='sum')
 
         self.convs = ModuleList()
         initial_channels = hidden_channels
         if self.use_feature:
             initial_channels += train_dataset.num_features
-        if self.node_embedding is not None:
+        if self.use_node_embedding:
             initial_channels += node_embedding.embedding_dim
 
         self.convs.append(GNN(initial_channels, hidden_channels))
@@ -174,8 +344,8 @@ class DGCNN(torch.nn.Module):
         self.convs.append(GNN(hidden_channels, 1))
 
         conv1d_channels = [16, 32]
-        total_latent_dim = hidden_channels * num_layers + 1
-        conv1d_kws = [total_latent_dim, 5]
+        self.total_latent_dim = hidden_channels * num_layers + 1
+        conv1d_kws = [self.total_latent_dim, 5]
         self.conv1 = Conv1d(1, conv1d_channels[0], conv1d_kws[0],
                             conv1d_kws[0])
         self.maxpool1d = MaxPool1d(2, 2)
@@ -185,34 +355,65 @@ class DGCNN(torch.nn.Module):
 
         dense_dim = (dense_dim - conv1d_kws[1] + 1) * conv1d_channels[1]
         self.dropedge = dropedge
-        self.mlp = MLP([dense_dim, 128, 1], dropout=0.5, batch_norm=False)
-
-    def forward(self, num_nodes, z, edge_index, batch, x=None, edge_weight=None, node_id=None):
-        edge_index, _ = dropout_adj(edge_index, p=self.dropedge,
-                                    force_undirected=True,
-                                    num_nodes=num_nodes,
-                                    training=self.training)
-
-        z_emb = self.z_embedding(z)
-        if z_emb.ndim == 3:  # in case z has multiple integer labels
-            z_emb = z_emb.sum(dim=1)
-        if self.use_feature and x is not None:
-            x = torch.cat([z_emb, x.to(torch.float)], 1)
-        else:
-            x = z_emb
-        if self.node_embedding is not None and node_id is not None:
-            n_emb = self.node_embedding(node_id)
-            x = torch.cat([x, n_emb], 1)
-        xs = [x]
+        self.conv_checkpointing = False
+        self.amp_dtype = None
+        self.mlp = TinyMLP(dense_dim, 128, dropout=0.5)
 
+    def reset_parameters(self):
+        # the node embedding is left alone, it can be pretrained and is re-initialized by the caller when trained
+        self.z_embedding.reset_parameters()
         for conv in self.convs:
-            xs += [torch.tanh(conv(xs[-1], edge_index, edge_weight))]
-        x = torch.cat(xs[1:], dim=-1)
+            conv.reset_parameters()
+        self.conv1.reset_parameters()
+        self.conv2.reset_parameters()
+        self.mlp.reset_parameters()
+
+    def enable_conv_checkpointing(self):
+        self.conv_checkpointing = True
+
+    def compile_forward(self, dynamic=True, mode='default'):
+        # compile the forward pass with TorchInductor; dynamic shapes as every batch has a different number of nodes.
+        # not named compile, which is nn.Module.compile in torch 2.x with a different contract
+        self.forward = torch.compile(self.forward, dynamic=dynamic, mode=mode)
+        return self
+
+    def conv_block(self, conv, x, adj_t):
+        return torch.tanh(conv(x, adj_t))
+
+    def forward(self, num_nodes: int, z: Tensor, edge_index: Tensor, batch: Tensor, x: Optional[Tensor] = None,
+                edge_weight: Optional[Tensor] = None, node_id: Optional[Tensor] = None):
+        training = self.training
+        if training and self.dropedge > 0:
+            # a dropped edge is an edge with zero weight, which saves rebuilding and coalescing edge_index
+            keep = undirected_edge_keep_mask(edge_index, num_nodes, self.dropedge)
+            edge_weight = keep.to(torch.float) if edge_weight is None else edge_weight * keep
+
+        # in case z has multiple integer labels, each row of z is one bag and its label embeddings are summed
+        z_emb = self.z_embedding(z.view(z.size(0), -1))
+        x = x if self.use_feature else None
+        n_emb = self.node_embedding(node_id) if self.use_node_embedding and node_id is not None else None
+        x = initial_node_features(z_emb, x, n_emb)
+
+        # every layer output is written straight into its slice of the latent buffer instead of a final torch.cat.
+        # only the GNN layers are checkpointed, the sort pooling and conv1d head are left as is
+        checkpointing = self.conv_checkpointing and training
+        adj_t = to_adj_t(edge_index, edge_weight, x.size(0))
+        latent = x.new_empty((x.size(0), self.total_latent_dim))
+        offset = 0
+        with conv_autocast(x.device, self.amp_dtype):
+            for conv in self.convs:
+                x = maybe_checkpoint(checkpointing, self.conv_block, conv, x, adj_t)
+                latent.narrow(1, offset, x.size(1)).copy_(x)
+                offset += x.size(1)
+        x = latent
 
         # Global pooling.
-        x = global_sort_pool(x, batch, self.k)
-        x = x.unsqueeze(1)  # [num_graphs, 1, k * hidden]
-        x = F.relu(self.conv1(x))
+        x = sort_pool(x, batch, self.k)
+        # conv1 has kernel size == stride == total_latent_dim, i.e. it is a linear layer applied to every sorted node.
+        # run it as a plain matmul on [num_graphs, k, total_latent_dim] instead of a conv over [num_graphs, 1, k * hidden]
+        x = x.view(x.size(0), self.k, self.total_latent_dim)
+        x = F.linear(x, self.conv1.weight.view(self.conv1.out_channels, -1), self.conv1.bias)
+        x = F.relu(x.transpose(1, 2))  # [num_graphs, conv1d_channels[0], k]
         x = self.maxpool1d(x)
         x = F.relu(self.conv2(x))
         x = x.view(x.size(0), -1)  # [num_graphs, dense_dim]
@@ -222,6 +423,31 @@ class DGCNN(torch.nn.Module):
         return x
 
 
+class GINMLP(Sequential):
+    # Linear -> ReLU -> Linear -> ReLU -> BN used inside every GINConv, with one hand-written forward so the whole
+    # block is dispatched and compiled as a unit. Still a Sequential of the same layers, so the parameter names
+    # (nn.0, nn.2, nn.4) and with them older GIN checkpoints stay compatible
+    def __init__(self, in_channels, hidden_channels):
+        super(GINMLP, self).__init__(
+            Linear(in_channels, hidden_channels),
+            ReLU(),
+            Linear(hidden_channels, hidden_channels),
+            ReLU(),
+            BN(hidden_channels),
+        )
+
+    def reset_parameters(self):
+        self[0].reset_parameters()
+        self[2].reset_parameters()
+        self[4].reset_parameters()
+
+    def pre_norm(self, x):
+        return F.relu(self[2](F.relu(self[0](x), inplace=True)), inplace=True)
+
+    def forward(self, x):
+        return self[4](self.pre_norm(x))
+
+
 class GIN(torch.nn.Module):
     def __init__(self, hidden_channels, num_layers, max_z, train_dataset,
                  use_feature=False, node_embedding=None, dropout=0.5,
@@ -229,70 +455,89 @@ class GIN(torch.nn.Module):
         super(GIN, self).__init__()
         self.use_feature = use_feature
         self.node_embedding = node_embedding
+        # resolved once here so forward does not need to re-inspect the modules on every step
+        self.use_node_embedding = node_embedding is not None
         self.max_z = max_z
-        self.z_embedding = Embedding(self.max_z, hidden_channels)
+        self.z_embedding = EmbeddingBag(self.max_z, hidden_channels, mode='sum')
         self.jk = jk
 
         initial_channels = hidden_channels
         if self.use_feature:
             initial_channels += train_dataset.num_features
-        if self.node_embedding is not None:
+        if self.use_node_embedding:
             initial_channels += node_embedding.embedding_dim
-        self.conv1 = GINConv(
-            Sequential(
-                Linear(initial_channels, hidden_channels),
-                ReLU(),
-                Linear(hidden_channels, hidden_channels),
-                ReLU(),
-                BN(hidden_channels),
-            ),
-            train_eps=train_eps)
+        self.conv1 = AmpGINConv(GINMLP(initial_channels, hidden_channels), train_eps=train_eps)
         self.convs = torch.nn.ModuleList()
         for i in range(num_layers - 1):
-            self.convs.append(
-                GINConv(
-                    Sequential(
-                        Linear(hidden_channels, hidden_channels),
-                        ReLU(),
-                        Linear(hidden_channels, hidden_channels),
-                        ReLU(),
-                        BN(hidden_channels),
-                    ),
-                    train_eps=train_eps))
+            self.convs.append(AmpGINConv(GINMLP(hidden_channels, hidden_channels), train_eps=train_eps))
 
         self.dropout = dropout
         if self.jk:
-            self.mlp = MLP([num_layers * hidden_channels, hidden_channels, 1], dropout=0.5, batch_norm=False)
+            self.mlp = TinyMLP(num_layers * hidden_channels, hidden_channels, dropout=0.5)
         else:
-            self.mlp = MLP([hidden_channels, hidden_channels, 1], dropout=0.5, batch_norm=False)
+            self.mlp = TinyMLP(hidden_channels, hidden_channels, dropout=0.5)
 
         self.dropedge = dropedge
+        self.conv_checkpointing = False
+        self.amp_dtype = None
 
-    def forward(self, num_nodes, z, edge_index, batch, x=None, edge_weight=None, node_id=None):
-        edge_index, _ = dropout_adj(edge_index, p=self.dropedge,
-                                    force_undirected=True,
-                                    num_nodes=num_nodes,
-                                    training=self.training)
-
-        z_emb = self.z_embedding(z)
-        if z_emb.ndim == 3:  # in case z has multiple integer labels
-            z_emb = z_emb.sum(dim=1)
-        if self.use_feature and x is not None:
-            x = torch.cat([z_emb, x.to(torch.float)], 1)
-        else:
-            x = z_emb
-        if self.node_embedding is not None and node_id is not None:
-            n_emb = self.node_embedding(node_id)
-            x = torch.cat([x, n_emb], 1)
-        x = self.conv1(x, edge_index)
-        xs = [x]
+    def reset_parameters(self):
+        # the node embedding is left alone, it can be pretrained and is re-initialized by the caller when trained
+        self.z_embedding.reset_parameters()
+        self.conv1.reset_parameters()
         for conv in self.convs:
-            x = conv(x, edge_index)
-            xs += [x]
+            conv.reset_parameters()
+        self.mlp.reset_parameters()
+
+    def enable_conv_checkpointing(self):
+        self.conv_checkpointing = True
+
+    def compile_forward(self, dynamic=True, mode='default'):
+        # compile the forward pass with TorchInductor; dynamic shapes as every batch has a different number of nodes.
+        # not named compile, which is nn.Module.compile in torch 2.x with a different contract
+        self.forward = torch.compile(self.forward, dynamic=dynamic, mode=mode)
+        return self
+
+    def conv_block(self, conv, x, adj_t):
+        # GINConv's forward up to (not including) the BatchNorm at the end of its MLP
+        out = conv.propagate(adj_t, x=(x, x), size=None)
+        out = out + (1 + conv.eps) * x
+        return conv.nn.pre_norm(out)
+
+    def gin_layer(self, conv, x, adj_t, checkpointing):
+        # only the aggregation and the Linear/ReLU part is checkpointed. A checkpointed BatchNorm would be run again
+        # in train mode during backward and update its running statistics twice per step
+        return conv.nn[4](maybe_checkpoint(checkpointing, self.conv_block, conv, x, adj_t))
+
+    def forward(self, num_nodes: int, z: Tensor, edge_index: Tensor, batch: Tensor, x: Optional[Tensor] = None,
+                edge_weight: Optional[Tensor] = None, node_id: Optional[Tensor] = None):
+        training = self.training
+        if training and self.dropedge > 0:
+            edge_index, _ = dropout_adj(edge_index, p=self.dropedge,
+                                        force_undirected=True,
+                                        num_nodes=num_nodes,
+                                        training=training)
+
+        # in case z has multiple integer labels, each row of z is one bag and its label embeddings are summed
+        z_emb = self.z_embedding(z.view(z.size(0), -1))
+        x = x if self.use_feature else None
+        n_emb = self.node_embedding(node_id) if self.use_node_embedding and node_id is not None else None
+        x = initial_node_features(z_emb, x, n_emb)
+        adj_t = to_adj_t(edge_index, None, x.size(0))
+        checkpointing = self.conv_checkpointing and training
+        with conv_autocast(x.device, self.amp_dtype):
+            x = self.gin_layer(self.conv1, x, adj_t, checkpointing)
+            if self.jk:
+                # every layer output is written straight into its slice of the jk buffer instead of a final torch.cat
+                jk = x.new_empty((x.size(0), x.size(1) * (len(self.convs) + 1)))
+                jk.narrow(1, 0, x.size(1)).copy_(x)
+            for i, conv in enumerate(self.convs, 1):
+                x = self.gin_layer(conv, x, adj_t, checkpointing)
+                if self.jk:
+                    jk.narrow(1, i * x.size(1), x.size(1)).copy_(x)
         if self.jk:
-            x = global_mean_pool(torch.cat(xs, dim=1), batch)
-        else:
-            x = global_mean_pool(xs[-1], batch)
+            x = jk
+        x = global_mean_pool(x.float(), batch)
         x = self.mlp(x)
 
         return x
@@ -1,17 +1,19 @@
 from timeit import default_timer
 
+import hashlib
 import numpy as np
 import networkx as nx
 import torch
 import shutil
 
 import argparse
+import math
 import time
 import os
 import sys
 import os.path as osp
 from shutil import copy
-import copy as cp
+from concurrent.futures import ThreadPoolExecutor
 
 import torch_geometric.utils
 from torch_geometric import seed_everything
@@ -24,12 +26,12 @@ import pdb
 
 from sklearn.metrics import roc_auc_score, average_precision_score
 import scipy.sparse as ssp
-from torch.nn import BCEWithLogitsLoss
+import torch.nn.functional as F
 
 from torch_sparse import coalesce, SparseTensor
 
 from torch_geometric.datasets import Planetoid, AttributedGraphDataset
-from torch_geometric.data import Dataset, InMemoryDataset, Data
+from torch_geometric.data import Dataset, InMemoryDataset, Data, Batch
 from torch_geometric.utils import to_undirected
 from torch_geometric import transforms as T
 
@@ -50,7 +52,7 @@ from ogbl_baselines.mlp_on_n2v import train_n2v_emb
 from ogbl_baselines.n2v import run_and_save_n2v
 from profiler_utils import profile_helper
 from utils import get_pos_neg_edges, extract_enclosing_subgraphs, construct_pyg_graph, k_hop_subgraph, do_edge_split, \
-    Logger, AA, CN, PPR, calc_ratio_helper, do_seal_edge_split
+    Logger, AA, CN, PPR, calc_ratio_helper, do_seal_edge_split, CUDAPrefetcher, random_walk_unique_nodes
 
 warnings.simplefilter('ignore', SparseEfficiencyWarning)
 warnings.simplefilter('ignore', FutureWarning)
@@ -61,7 +63,7 @@ class SEALDataset(InMemoryDataset):
     def __init__(self, root, data, split_edge, num_hops, percent=100, split='train',
                  use_coalesce=False, node_label='drnl', ratio_per_hop=1.0,
                  max_nodes_per_hop=None, directed=False, rw_kwargs=None, device='cpu', pairwise=False,
-                 pos_pairwise=False, neg_ratio=1):
+                 pos_pairwise=False, neg_ratio=1, extract_workers=1, keep_in_memory=False):
         self.data = data
         self.split_edge = split_edge
         self.num_hops = num_hops
@@ -77,15 +79,26 @@ class SEALDataset(InMemoryDataset):
         self.E = self.data.edge_index.size()[-1]
         self.sparse_adj = SparseTensor(
             row=self.data.edge_index[0].to(self.device), col=self.data.edge_index[1].to(self.device),
-            value=torch.arange(self.E, device=self.device),
+            value=torch.arange(self.E, dtype=torch.int32, device=self.device),
             sparse_sizes=(self.N, self.N))
         self.rw_kwargs = rw_kwargs
         self.pairwise = pairwise
         self.pos_pairwise = pos_pairwise
         self.neg_ratio = neg_ratio
+        self.extract_workers = extract_workers
+        self.keep_in_memory = keep_in_memory
+        self._collated = None
         super(SEALDataset, self).__init__(root)
         if not self.rw_kwargs.get('calc_ratio', False):
-            self.data, self.slices = torch.load(self.processed_paths[0])
+            if self._collated is not None:
+                # just processed with keep_in_memory, no need to read back what was never written
+                self.data, self.slices = self._collated
+                self._collated = None
+            else:
+                self.data, self.slices = torch.load(self.processed_paths[0])
+            if self.data.y.dtype != torch.float:
+                # files processed before labels were stored as float, cast once here instead of every step
+                self.data.y = self.data.y.float()
 
     @property
     def processed_file_names(self):
@@ -96,6 +109,12 @@ class SEALDataset(InMemoryDataset):
         name += '.pt'
         return [name]
 
+    def save_processed(self, data_list):
+        if self.keep_in_memory:
+            self._collated = self.collate(data_list)
+        else:
+            torch.save(self.collate(data_list), self.processed_paths[0])
+
     def process(self):
         pos_edge, neg_edge = get_pos_neg_edges(self.split, self.split_edge,
                                                self.data.edge_index,
@@ -108,11 +127,12 @@ class SEALDataset(InMemoryDataset):
                 self.data.num_nodes, self.data.num_nodes)
 
         if 'edge_weight' in self.data:
-            edge_weight = self.data.edge_weight.view(-1)
+            edge_weight = self.data.edge_weight.view(-1).numpy()
         else:
-            edge_weight = torch.ones(self.data.edge_index.size(1), dtype=int)
+            # a stride-0 view of a single one instead of materializing an E-length weight vector
+            edge_weight = np.broadcast_to(np.int32(1), (self.data.edge_index.size(1),))
         A = ssp.csr_matrix(
-            (edge_weight, (self.data.edge_index[0], self.data.edge_index[1])),
+            (edge_weight, (self.data.edge_index[0].numpy(), self.data.edge_index[1].numpy())),
             shape=(self.data.num_nodes, self.data.num_nodes)
         )
 
@@ -139,32 +159,48 @@ class SEALDataset(InMemoryDataset):
                               args.dataset, args.seed)
             exit()
 
+        # the links this call extracts: both sets, or only the pos or neg ones of a pairwise dataset
+        if not self.pairwise:
+            links = torch.cat([pos_edge, neg_edge], 1)
+        else:
+            links = pos_edge if self.pos_pairwise else neg_edge
+
+        if self.rw_kwargs.get('M'):
+            # walk all links in batched calls up front instead of launching the walks link by link
+            rw_kwargs['unique_nodes'] = random_walk_unique_nodes(
+                self.sparse_adj, links, self.rw_kwargs.get('m'), self.rw_kwargs.get('M'))
+
         if not self.pairwise:
-            print("Setting up Positive Subgraphs")
-            pos_list = extract_enclosing_subgraphs(
-                pos_edge, A, self.data.x, 1, self.num_hops, self.node_label,
-                self.ratio_per_hop, self.max_nodes_per_hop, self.directed, A_csc, rw_kwargs)
-            print("Setting up Negative Subgraphs")
-            neg_list = extract_enclosing_subgraphs(
-                neg_edge, A, self.data.x, 0, self.num_hops, self.node_label,
-                self.ratio_per_hop, self.max_nodes_per_hop, self.directed, A_csc, rw_kwargs)
-            torch.save(self.collate(pos_list + neg_list), self.processed_paths[0])
-            del pos_list, neg_list
+            print("Setting up Positive and Negative Subgraphs")
+            labels = torch.cat([torch.ones(pos_edge.size(1), dtype=torch.long),
+                                torch.zeros(neg_edge.size(1), dtype=torch.long)])
+            data_list = extract_enclosing_subgraphs(
+                links, A, self.data.x, labels, self.num_hops, self.node_label,
+                self.ratio_per_hop, self.max_nodes_per_hop, self.directed, A_csc, rw_kwargs,
+                self.extract_workers)
+            self.save_processed(data_list)
+            del data_list
         else:
             if self.pos_pairwise:
                 pos_list = extract_enclosing_subgraphs(
-                    pos_edge, A, self.data.x, 1, self.num_hops, self.node_label,
-                    self.ratio_per_hop, self.max_nodes_per_hop, self.directed, A_csc, rw_kwargs)
-                torch.save(self.collate(pos_list), self.processed_paths[0])
+                    links, A, self.data.x, 1, self.num_hops, self.node_label,
+                    self.ratio_per_hop, self.max_nodes_per_hop, self.directed, A_csc, rw_kwargs,
+                    self.extract_workers)
+                self.save_processed(pos_list)
                 del pos_list
             else:
                 neg_list = extract_enclosing_subgraphs(
-                    neg_edge, A, self.data.x, 0, self.num_hops, self.node_label,
-                    self.ratio_per_hop, self.max_nodes_per_hop, self.directed, A_csc, rw_kwargs)
-                torch.save(self.collate(neg_list), self.processed_paths[0])
+                    links, A, self.data.x, 0, self.num_hops, self.node_label,
+                    self.ratio_per_hop, self.max_nodes_per_hop, self.directed, A_csc, rw_kwargs,
+                    self.extract_workers)
+                self.save_processed(neg_list)
                 del neg_list
 
 
+# bumped whenever the on-disk layout of the dynamic subgraph cache changes, so older caches are never misread
+SUBGRAPH_CACHE_FORMAT = 2
+
+
 class SEALDynamicDataset(Dataset):
     def __init__(self, root, data, split_edge, num_hops, percent=100, split='train',
                  use_coalesce=False, node_label='drnl', ratio_per_hop=1.0,
@@ -174,6 +210,7 @@ class SEALDynamicDataset(Dataset):
         self.split_edge = split_edge
         self.num_hops = num_hops
         self.percent = percent
+        self.split = split
         self.use_coalesce = use_coalesce
         self.node_label = node_label
         self.ratio_per_hop = ratio_per_hop
@@ -185,7 +222,7 @@ class SEALDynamicDataset(Dataset):
         self.E = self.data.edge_index.size()[-1]
         self.sparse_adj = SparseTensor(
             row=self.data.edge_index[0].to(self.device), col=self.data.edge_index[1].to(self.device),
-            value=torch.arange(self.E, device=self.device),
+            value=torch.arange(self.E, dtype=torch.int32, device=self.device),
             sparse_sizes=(self.N, self.N))
         self.pairwise = pairwise
         self.pos_pairwise = pos_pairwise
@@ -198,14 +235,16 @@ class SEALDynamicDataset(Dataset):
                                                self.percent, neg_ratio=self.neg_ratio)
         if self.pairwise:
             if self.pos_pairwise:
-                self.links = pos_edge.t().tolist()
-                self.labels = [1] * pos_edge.size(1)
+                self.links = pos_edge.t().contiguous()
+                self.labels = torch.ones(pos_edge.size(1), dtype=torch.long)
             else:
-                self.links = neg_edge.t().tolist()
-                self.labels = [0] * neg_edge.size(1)
+                self.links = neg_edge.t().contiguous()
+                self.labels = torch.zeros(neg_edge.size(1), dtype=torch.long)
         else:
-            self.links = torch.cat([pos_edge, neg_edge], 1).t().tolist()
-            self.labels = [1] * pos_edge.size(1) + [0] * neg_edge.size(1)
+            # links and labels stay tensors, get() only converts the one link it needs
+            self.links = torch.cat([pos_edge, neg_edge], 1).t().contiguous()
+            self.labels = torch.cat([torch.ones(pos_edge.size(1), dtype=torch.long),
+                                     torch.zeros(neg_edge.size(1), dtype=torch.long)])
 
         if self.use_coalesce:  # compress mutli-edge into edge with weight
             self.data.edge_index, self.data.edge_weight = coalesce(
@@ -213,11 +252,12 @@ class SEALDynamicDataset(Dataset):
                 self.data.num_nodes, self.data.num_nodes)
 
         if 'edge_weight' in self.data:
-            edge_weight = self.data.edge_weight.view(-1)
+            edge_weight = self.data.edge_weight.view(-1).numpy()
         else:
-            edge_weight = torch.ones(self.data.edge_index.size(1), dtype=int)
+            # a stride-0 view of a single one instead of materializing an E-length weight vector
+            edge_weight = np.broadcast_to(np.int32(1), (self.data.edge_index.size(1),))
         self.A = ssp.csr_matrix(
-            (edge_weight, (self.data.edge_index[0], self.data.edge_index[1])),
+            (edge_weight, (self.data.edge_index[0].numpy(), self.data.edge_index[1].numpy())),
             shape=(self.data.num_nodes, self.data.num_nodes)
         )
         if self.directed:
@@ -231,26 +271,13 @@ class SEALDynamicDataset(Dataset):
             # if in dynamic SWEAL mode, need to cache the unique nodes of random walks before get() due to below error
             # RuntimeError: Cannot re-initialize CUDA in forked subprocess.
             # To use CUDA with multiprocessing, you must use the 'spawn' start method
-            for link in self.links:
-                rw_M = self.rw_kwargs.get('M')
-                starting_nodes = []
-                [starting_nodes.extend(link) for _ in range(rw_M)]
-                start = torch.tensor(starting_nodes, dtype=torch.long, device=device)
-                rw = self.sparse_adj.random_walk(start.flatten(), self.rw_kwargs.get('m'))
-                self.unique_nodes[tuple(link)] = torch.unique(rw.flatten()).tolist()
+            self.unique_nodes = random_walk_unique_nodes(
+                self.sparse_adj, self.links.t(), self.rw_kwargs.get('m'),
+                self.rw_kwargs.get('M'))
             print("Finish caching random walk unique nodes")
 
-    def __len__(self):
-        return len(self.links)
-
-    def len(self):
-        return self.__len__()
-
-    def get(self, idx):
-        src, dst = self.links[idx]
-        y = self.labels[idx]
-
-        rw_kwargs = {
+        # built once here instead of on every get() call
+        self._rw_kwargs = {
             "rw_m": self.rw_kwargs.get('m'),
             "rw_M": self.rw_kwargs.get('M'),
             "sparse_adj": self.sparse_adj,
@@ -260,6 +287,87 @@ class SEALDynamicDataset(Dataset):
             "unique_nodes": self.unique_nodes
         }
 
+        self.cache_dir = None
+        self._cache = None
+        # only cache deterministic extractions; per-hop sampling should be redrawn every epoch. random walk subgraphs
+        # are not cached either, the walks are drawn anew for every run so their cache would never be reused and
+        # every run would leave another cache directory behind
+        deterministic = self.ratio_per_hop == 1.0 and self.max_nodes_per_hop is None
+        if self.rw_kwargs.get('cache_subgraphs') and deterministic and not self.rw_kwargs.get('M'):
+            self.cache_dir = osp.join(root, f'subgraph_cache_{self.split}_{self.subgraph_cache_key()}')
+            if not osp.exists(osp.join(self.cache_dir, 'sizes.npy')):
+                print(f"Caching {self.split} subgraphs to {self.cache_dir}")
+                self.build_subgraph_cache()
+            sizes = np.load(osp.join(self.cache_dir, 'sizes.npy'))
+            self.cache_sizes = sizes.tolist()
+            # each cached subgraph is laid out as [node_id (n), z (n * z_cols), edge_index (2 * e)] in cache.bin and
+            # edge_weight (e) in edge_weight.bin. z_cols is 0 for the usual 1-d labels (stored as n values) and the
+            # number of columns for 2-d ones like de/de+
+            z_len = sizes[:, 0] * np.maximum(sizes[:, 2], 1)
+            self.cache_offsets = np.concatenate([[0], np.cumsum(sizes[:, 0] + z_len + 2 * sizes[:, 1])]).tolist()
+            self.weight_offsets = np.concatenate([[0], np.cumsum(sizes[:, 1])]).tolist()
+
+    def subgraph_cache_key(self):
+        # hash everything that determines the extracted subgraphs, a changed graph, split or setting maps to a
+        # fresh cache directory
+        hasher = hashlib.sha1()
+        hasher.update(self.data.edge_index.cpu().numpy().tobytes())
+        hasher.update(self.links.numpy().tobytes())
+        hasher.update(repr((SUBGRAPH_CACHE_FORMAT, self.num_hops, self.node_label, self.directed, self.pairwise,
+                            self.pos_pairwise)).encode())
+        return hasher.hexdigest()[:16]
+
+    def build_subgraph_cache(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        sizes = np.empty((len(self.links), 3), dtype=np.int64)
+        with open(osp.join(self.cache_dir, 'cache.bin'), 'wb') as cache_file, \
+                open(osp.join(self.cache_dir, 'edge_weight.bin'), 'wb') as weight_file:
+            for idx in tqdm(range(len(self.links)), ncols=70):
+                data = self.extract_subgraph(idx)
+                sizes[idx] = data.num_nodes, data.edge_index.size(1), data.z.size(1) if data.z.dim() == 2 else 0
+                for value in [data.node_id, data.z, data.edge_index]:
+                    cache_file.write(value.numpy().astype(np.int64).tobytes())
+                weight_file.write(data.edge_weight.numpy().astype(np.float32).tobytes())
+        # sizes.npy is written last so that an interrupted build is never picked up as a complete cache
+        np.save(osp.join(self.cache_dir, 'sizes.npy'), sizes)
+
+    def load_cached_subgraph(self, idx):
+        if self._cache is None:
+            # opened lazily so that every DataLoader worker maps the files itself; copy-on-write keeps the
+            # tensors writable without copying the pages up front
+            self._cache = (np.memmap(osp.join(self.cache_dir, 'cache.bin'), dtype=np.int64, mode='c'),
+                           np.memmap(osp.join(self.cache_dir, 'edge_weight.bin'), dtype=np.float32, mode='c'))
+        cache, weight_cache = self._cache
+        num_nodes, num_edges, z_cols = self.cache_sizes[idx]
+        block = torch.from_numpy(cache[self.cache_offsets[idx]:self.cache_offsets[idx + 1]])
+        z_end = num_nodes + num_nodes * max(z_cols, 1)
+        node_id, z, edge_index = block[:num_nodes], block[num_nodes:z_end], block[z_end:]
+        if z_cols:
+            z = z.view(num_nodes, z_cols)
+        edge_weight = torch.from_numpy(weight_cache[self.weight_offsets[idx]:self.weight_offsets[idx + 1]])
+
+        x = self.data.x[node_id] if getattr(self.data, 'x', None) is not None else None
+        y = self.labels[idx].item()
+        y = torch.tensor([y], dtype=torch.float)
+        return Data(x, edge_index.view(2, num_edges), edge_weight=edge_weight, y=y, z=z, node_id=node_id,
+                    num_nodes=num_nodes)
+
+    def __len__(self):
+        return len(self.links)
+
+    def len(self):
+        return self.__len__()
+
+    def get(self, idx):
+        if self.cache_dir is not None:
+            return self.load_cached_subgraph(idx)
+        return self.extract_subgraph(idx)
+
+    def extract_subgraph(self, idx):
+        src, dst = self.links[idx].tolist()
+        y = self.labels[idx].item()
+        rw_kwargs = self._rw_kwargs
+
         if not rw_kwargs['rw_m']:
             tmp = k_hop_subgraph(src, dst, self.num_hops, self.A, self.ratio_per_hop,
                                  self.max_nodes_per_hop, node_features=self.data.x,
@@ -273,87 +381,168 @@ class SEALDynamicDataset(Dataset):
         return data
 
 
+class PairwiseDataset(torch.utils.data.Dataset):
+    # serves the positive and negative training subgraphs of train_pairwise through one DataLoader (and one set of
+    # workers). Indices are (is_negative, idx) pairs as produced by PairwiseBatchSampler
+    def __init__(self, pos_dataset, neg_dataset):
+        self.datasets = (pos_dataset, neg_dataset)
+
+    def __len__(self):
+        return len(self.datasets[0])
+
+    def __getitem__(self, index):
+        is_negative, idx = index
+        return is_negative, self.datasets[is_negative][idx]
+
+    @staticmethod
+    def collate(items):
+        pos_data = Batch.from_data_list([data for is_negative, data in items if not is_negative])
+        neg_data = Batch.from_data_list([data for is_negative, data in items if is_negative])
+        return pos_data, neg_data
+
+
+class PairwiseBatchSampler(torch.utils.data.Sampler):
+    # independently shuffled positive and negative streams, batch_size positives and batch_size * neg_ratio
+    # negatives per batch; the same batches the separate positive and negative loaders used to produce
+    def __init__(self, num_pos, num_neg, batch_size, neg_ratio):
+        self.num_pos = num_pos
+        self.num_neg = num_neg
+        self.batch_size = batch_size
+        self.neg_batch_size = batch_size * neg_ratio
+
+    def __len__(self):
+        return math.ceil(self.num_pos / self.batch_size)
+
+    def __iter__(self):
+        pos_perm = torch.randperm(self.num_pos).tolist()
+        neg_perm = torch.randperm(self.num_neg).tolist()
+        for i in range(len(self)):
+            pos = pos_perm[i * self.batch_size:(i + 1) * self.batch_size]
+            neg = neg_perm[i * self.neg_batch_size:(i + 1) * self.neg_batch_size]
+            yield [(0, idx) for idx in pos] + [(1, idx) for idx in neg]
+
+
+# dataset class per value of the dynamic_{train,val,test} flags
+DATASET_CLS = {True: SEALDynamicDataset, False: SEALDataset}
+MODELS = {'DGCNN': DGCNN, 'SAGE': SAGE, 'GCN': GCN, 'GIN': GIN}
+
+
+def bce_forward_loss(model, num_nodes, z, edge_index, batch, x, edge_weight, node_id, y):
+    # forward pass + BCE logit loss of one training step, kept in one function so that --compile can compile both
+    # together (run_sweal passes the compiled or plain version to the training loops as forward_loss)
+    logits = model(num_nodes, z, edge_index, batch, x, edge_weight, node_id)
+    return F.binary_cross_entropy_with_logits(logits.view(-1), y)
+
+
 @profileit()
-def profile_train(model, train_loader, optimizer, device, emb, train_dataset, args):
+def profile_train(model, train_loader, optimizer, device, emb, train_dataset, args, forward_loss, grad_scaler):
     # normal training with BCE logit loss with profiling enabled
     model.train()
 
     total_loss = 0
-    pbar = tqdm(train_loader, ncols=70)
+    pbar = tqdm(CUDAPrefetcher(train_loader, device), ncols=70)
+    # flags are fixed for the whole run, read them once instead of on every step
+    use_feature, use_edge_weight, use_emb = args.use_feature, args.use_edge_weight, emb is not None
     for data in pbar:
-        data = data.to(device)
-        optimizer.zero_grad()
-        x = data.x if args.use_feature else None
-        edge_weight = data.edge_weight if args.use_edge_weight else None
-        node_id = data.node_id if emb else None
+        optimizer.zero_grad(set_to_none=True)
+        x = data.x if use_feature else None
+        edge_weight = data.edge_weight if use_edge_weight else None
+        node_id = data.node_id if use_emb else None
         num_nodes = data.num_nodes
-        logits = model(num_nodes, data.z, data.edge_index, data.batch, x, edge_weight, node_id)
-        loss = BCEWithLogitsLoss()(logits.view(-1), data.y.to(torch.float))
-        loss.backward()
-        optimizer.step()
+        loss = forward_loss(model, num_nodes, data.z, data.edge_index, data.batch, x, edge_weight, node_id, data.y)
+        grad_scaler.scale(loss).backward()
+        grad_scaler.step(optimizer)
+        grad_scaler.update()
         total_loss += loss.item() * data.num_graphs
 
     return total_loss / len(train_dataset)
 
 
-def train_bce(model, train_loader, optimizer, device, emb, train_dataset, args):
+def train_bce(model, train_loader, optimizer, device, emb, train_dataset, args, forward_loss, grad_scaler):
     # normal training with BCE logit loss
     model.train()
 
     total_loss = 0
-    pbar = tqdm(train_loader, ncols=70)
+    pbar = tqdm(CUDAPrefetcher(train_loader, device), ncols=70)
+    use_feature, use_edge_weight, use_emb = args.use_feature, args.use_edge_weight, emb is not None
     for data in pbar:
-        data = data.to(device)
-        optimizer.zero_grad()
-        x = data.x if args.use_feature else None
-        edge_weight = data.edge_weight if args.use_edge_weight else None
-        node_id = data.node_id if emb else None
+        optimizer.zero_grad(set_to_none=True)
+        x = data.x if use_feature else None
+        edge_weight = data.edge_weight if use_edge_weight else None
+        node_id = data.node_id if use_emb else None
         num_nodes = data.num_nodes
-        logits = model(num_nodes, data.z, data.edge_index, data.batch, x, edge_weight, node_id)
-        loss = BCEWithLogitsLoss()(logits.view(-1), data.y.to(torch.float))
-        loss.backward()
-        optimizer.step()
+        loss = forward_loss(model, num_nodes, data.z, data.edge_index, data.batch, x, edge_weight, node_id, data.y)
+        grad_scaler.scale(loss).backward()
+        grad_scaler.step(optimizer)
+        grad_scaler.update()
         total_loss += loss.item() * data.num_graphs
 
     return total_loss / len(train_dataset)
 
 
-def train_pairwise(model, train_positive_loader, train_negative_loader, optimizer, device, emb, train_dataset, args):
+def train_pairwise(model, train_pairwise_loader, optimizer, device, emb, train_dataset, args, grad_scaler):
     # pairwise training with AUC loss + many others from PLNLP paper
     model.train()
 
     total_loss = 0
-    pbar = tqdm(train_positive_loader, ncols=70)
-    train_negative_loader = iter(train_negative_loader)
+    pbar = tqdm(CUDAPrefetcher(train_pairwise_loader, device), ncols=70)
 
-    for indx, data in enumerate(pbar):
-        pos_data = data.to(device)
-        optimizer.zero_grad()
+    use_feature, use_edge_weight, use_emb = args.use_feature, args.use_edge_weight, emb is not None
+    loss_fn = get_loss(args.loss_fn)
+    for pos_data, neg_data in pbar:
+        optimizer.zero_grad(set_to_none=True)
 
-        pos_x = pos_data.x if args.use_feature else None
-        pos_edge_weight = pos_data.edge_weight if args.use_edge_weight else None
-        pos_node_id = pos_data.node_id if emb else None
+        pos_x = pos_data.x if use_feature else None
+        pos_edge_weight = pos_data.edge_weight if use_edge_weight else None
+        pos_node_id = pos_data.node_id if use_emb else None
         pos_num_nodes = pos_data.num_nodes
-        pos_logits = model(pos_num_nodes, pos_data.z, pos_data.edge_index, data.batch, pos_x, pos_edge_weight,
+        pos_logits = model(pos_num_nodes, pos_data.z, pos_data.edge_index, pos_data.batch, pos_x, pos_edge_weight,
                            pos_node_id)
 
-        neg_data = next(train_negative_loader).to(device)
-        neg_x = neg_data.x if args.use_feature else None
-        neg_edge_weight = neg_data.edge_weight if args.use_edge_weight else None
-        neg_node_id = neg_data.node_id if emb else None
+        neg_x = neg_data.x if use_feature else None
+        neg_edge_weight = neg_data.edge_weight if use_edge_weight else None
+        neg_node_id = neg_data.node_id if use_emb else None
         neg_num_nodes = neg_data.num_nodes
         neg_logits = model(neg_num_nodes, neg_data.z, neg_data.edge_index, neg_data.batch, neg_x, neg_edge_weight,
                            neg_node_id)
-        loss_fn = get_loss(args.loss_fn)
         loss = loss_fn(pos_logits, neg_logits, args.neg_ratio)
 
-        loss.backward()
-        optimizer.step()
-        total_loss += loss.item() * data.num_graphs
+        grad_scaler.scale(loss).backward()
+        grad_scaler.step(optimizer)
+        grad_scaler.update()
+        total_loss += loss.item() * pos_data.num_graphs
 
     return total_loss / len(train_dataset)
 
 
+def init_loader_worker(worker_id):
+    # every DataLoader worker would otherwise start its own intra-op thread pool sized for the whole machine,
+    # num_workers of those thrash the CPU during dynamic subgraph extraction
+    torch.set_num_threads(1)
+
+
+def state_dict_to_cpu(state):
+    # detached CPU copy of a (nested) state dict that a background thread can serialize while training carries on;
+    # CPU tensors are copied too as the optimizer keeps updating them in place
+    if torch.is_tensor(state):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return {key: state_dict_to_cpu(value) for key, value in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(state_dict_to_cpu(value) for value in state)
+    return state
+
+
+def get_adam(parameters, lr):
+    # fused Adam (PyTorch 2.0+, CUDA params) updates all parameters in one kernel and the foreach version (1.12+)
+    # in a few multi-tensor kernels; older versions fall back to the per-parameter loop
+    for kwargs in [{'fused': True}, {'foreach': True}, {}]:
+        try:
+            return torch.optim.Adam(params=parameters, lr=lr, **kwargs)
+        except (TypeError, RuntimeError, ValueError):
+            continue
+
+
 def get_loss(loss_function):
     if loss_function == 'auc_loss':
         return auc_loss
@@ -363,35 +552,35 @@ def get_loss(loss_function):
         raise NotImplementedError(f'Loss function {loss_function} not implemented')
 
 
+@torch.no_grad()
+def predict(model, loader, device, emb, args):
+    # predictions and labels are written into preallocated device buffers and copied to the CPU once at the end
+    y_pred = torch.empty(len(loader.dataset), device=device)
+    y_true = torch.empty(len(loader.dataset), device=device)
+    offset = 0
+    use_feature, use_edge_weight, use_emb = args.use_feature, args.use_edge_weight, emb is not None
+    for data in tqdm(CUDAPrefetcher(loader, device), ncols=70):
+        x = data.x if use_feature else None
+        edge_weight = data.edge_weight if use_edge_weight else None
+        node_id = data.node_id if use_emb else None
+        num_nodes = data.num_nodes
+        logits = model(num_nodes, data.z, data.edge_index, data.batch, x, edge_weight, node_id)
+        batch_size = data.num_graphs
+        y_pred[offset:offset + batch_size] = logits.view(-1)
+        y_true[offset:offset + batch_size] = data.y.view(-1)
+        offset += batch_size
+    return y_pred[:offset].cpu(), y_true[:offset].cpu()
+
+
 @torch.no_grad()
 def test(evaluator, model, val_loader, device, emb, test_loader, args):
     model.eval()
 
-    y_pred, y_true = [], []
-    for data in tqdm(val_loader, ncols=70):
-        data = data.to(device)
-        x = data.x if args.use_feature else None
-        edge_weight = data.edge_weight if args.use_edge_weight else None
-        node_id = data.node_id if emb else None
-        num_nodes = data.num_nodes
-        logits = model(num_nodes, data.z, data.edge_index, data.batch, x, edge_weight, node_id)
-        y_pred.append(logits.view(-1).cpu())
-        y_true.append(data.y.view(-1).cpu().to(torch.float))
-    val_pred, val_true = torch.cat(y_pred), torch.cat(y_true)
+    val_pred, val_true = predict(model, val_loader, device, emb, args)
     pos_val_pred = val_pred[val_true == 1]
     neg_val_pred = val_pred[val_true == 0]
 
-    y_pred, y_true = [], []
-    for data in tqdm(test_loader, ncols=70):
-        data = data.to(device)
-        x = data.x if args.use_feature else None
-        edge_weight = data.edge_weight if args.use_edge_weight else None
-        node_id = data.node_id if emb else None
-        num_nodes = data.num_nodes
-        logits = model(num_nodes, data.z, data.edge_index, data.batch, x, edge_weight, node_id)
-        y_pred.append(logits.view(-1).cpu())
-        y_true.append(data.y.view(-1).cpu().to(torch.float))
-    test_pred, test_true = torch.cat(y_pred), torch.cat(y_true)
+    test_pred, test_true = predict(model, test_loader, device, emb, args)
     pos_test_pred = test_pred[test_true == 1]
     neg_test_pred = test_pred[test_true == 0]
 
@@ -405,70 +594,25 @@ def test(evaluator, model, val_loader, device, emb, test_loader, args):
     return results
 
 
-@torch.no_grad()
-def test_multiple_models(models, val_loader, device, emb, test_loader, evaluator, args):
-    raise NotImplementedError("This is untested for SCALED")
-    for m in models:
-        m.eval()
-
-    y_pred, y_true = [[] for _ in range(len(models))], [[] for _ in range(len(models))]
-    for data in tqdm(val_loader, ncols=70):
-        data = data.to(device)
-        x = data.x if args.use_feature else None
-        edge_weight = data.edge_weight if args.use_edge_weight else None
-        node_id = data.node_id if emb else None
-        for i, m in enumerate(models):
-            logits = m(data.z, data.edge_index, data.batch, x, edge_weight, node_id)
-            y_pred[i].append(logits.view(-1).cpu())
-            y_true[i].append(data.y.view(-1).cpu().to(torch.float))
-    val_pred = [torch.cat(y_pred[i]) for i in range(len(models))]
-    val_true = [torch.cat(y_true[i]) for i in range(len(models))]
-    pos_val_pred = [val_pred[i][val_true[i] == 1] for i in range(len(models))]
-    neg_val_pred = [val_pred[i][val_true[i] == 0] for i in range(len(models))]
-
-    y_pred, y_true = [[] for _ in range(len(models))], [[] for _ in range(len(models))]
-    for data in tqdm(test_loader, ncols=70):
-        data = data.to(device)
-        x = data.x if args.use_feature else None
-        edge_weight = data.edge_weight if args.use_edge_weight else None
-        node_id = data.node_id if emb else None
-        for i, m in enumerate(models):
-            logits = m(data.z, data.edge_index, data.batch, x, edge_weight, node_id)
-            y_pred[i].append(logits.view(-1).cpu())
-            y_true[i].append(data.y.view(-1).cpu().to(torch.float))
-    test_pred = [torch.cat(y_pred[i]) for i in range(len(models))]
-    test_true = [torch.cat(y_true[i]) for i in range(len(models))]
-    pos_test_pred = [test_pred[i][test_true[i] == 1] for i in range(len(models))]
-    neg_test_pred = [test_pred[i][test_true[i] == 0] for i in range(len(models))]
-
-    Results = []
-    for i in range(len(models)):
-        if args.eval_metric == 'hits':
-            Results.append(evaluate_hits(pos_val_pred[i], neg_val_pred[i],
-                                         pos_test_pred[i], neg_test_pred[i]))
-        elif args.eval_metric == 'mrr':
-            Results.append(evaluate_mrr(pos_val_pred[i], neg_val_pred[i],
-                                        pos_test_pred[i], neg_test_pred[i], evaluator))
-        elif args.eval_metric == 'auc':
-            Results.append(evaluate_auc(val_pred[i], val_true[i],
-                                        test_pred[i], test_pred[i]))
-    return Results
+def hits_at_k(pos_pred, neg_pred, Ks):
+    # same as ogb's Evaluator for hits@K, but one topk over the negatives serves every K
+    neg_topk = torch.topk(neg_pred, min(max(Ks), neg_pred.numel()))[0]
+    hits = {}
+    for K in Ks:
+        if neg_pred.numel() < K:
+            hits[K] = 1.
+        else:
+            hits[K] = float(torch.sum(pos_pred > neg_topk[K - 1]).cpu()) / len(pos_pred)
+    return hits
 
 
 def evaluate_hits(pos_val_pred, neg_val_pred, pos_test_pred, neg_test_pred, evaluator):
     results = {}
-    for K in [20, 50, 100]:
-        evaluator.K = K
-        valid_hits = evaluator.eval({
-            'y_pred_pos': pos_val_pred,
-            'y_pred_neg': neg_val_pred,
-        })[f'hits@{K}']
-        test_hits = evaluator.eval({
-            'y_pred_pos': pos_test_pred,
-            'y_pred_neg': neg_test_pred,
-        })[f'hits@{K}']
-
-        results[f'Hits@{K}'] = (valid_hits, test_hits)
+    Ks = [20, 50, 100]
+    valid_hits = hits_at_k(pos_val_pred, neg_val_pred, Ks)
+    test_hits = hits_at_k(pos_test_pred, neg_test_pred, Ks)
+    for K in Ks:
+        results[f'Hits@{K}'] = (valid_hits[K], test_hits[K])
 
     return results
 
@@ -516,7 +660,9 @@ class SWEALArgumentParser:
                  data_appendix, save_appendix, keep_old, continue_from, only_test, test_multiple_models, use_heuristic,
                  m, M, dropedge, calc_ratio, checkpoint_training, delete_dataset, pairwise, loss_fn, neg_ratio,
                  profile, split_val_ratio, split_test_ratio, train_mlp, dropout, train_gae, base_gae, dataset_stats,
-                 seed, dataset_split_num, train_n2v, train_mf):
+                 seed, dataset_split_num, train_n2v, train_mf, conv_checkpointing=False,
+                 compile=False, amp_dtype=None, cache_dynamic_subgraphs=False,
+                 extract_workers=1, keep_in_memory=False, prefetch_factor=2):
         # Data Settings
         self.dataset = dataset
         self.fast_split = fast_split
@@ -584,6 +730,13 @@ class SWEALArgumentParser:
         self.dataset_split_num = dataset_split_num
         self.train_n2v = train_n2v
         self.train_mf = train_mf
+        self.conv_checkpointing = conv_checkpointing
+        self.compile = compile
+        self.amp_dtype = amp_dtype
+        self.cache_dynamic_subgraphs = cache_dynamic_subgraphs
+        self.extract_workers = extract_workers
+        self.keep_in_memory = keep_in_memory
+        self.prefetch_factor = prefetch_factor
 
 
 def run_sweal(args, device):
@@ -757,10 +910,12 @@ def run_sweal(args, device):
         pos_test_edge, neg_test_edge = get_pos_neg_edges('test', split_edge,
                                                          data.edge_index,
                                                          data.num_nodes, neg_ratio=args.neg_ratio)
-        pos_val_pred, pos_val_edge = eval(args.use_heuristic)(A, pos_val_edge)
-        neg_val_pred, neg_val_edge = eval(args.use_heuristic)(A, neg_val_edge)
-        pos_test_pred, pos_test_edge = eval(args.use_heuristic)(A, pos_test_edge)
-        neg_test_pred, neg_test_edge = eval(args.use_heuristic)(A, neg_test_edge)
+        # score all four edge sets in one heuristic call so its setup (AA's degree weighting, PPR's per-source
+        # pagerank) is done once over the union of the edges
+        edge_sets = [pos_val_edge, neg_val_edge, pos_test_edge, neg_test_edge]
+        pred, _ = eval(args.use_heuristic)(A, torch.cat(edge_sets, 1))
+        pos_val_pred, neg_val_pred, pos_test_pred, neg_test_pred = torch.split(
+            pred, [edges.size(1) for edges in edge_sets])
 
         if args.eval_metric == 'hits':
             results = evaluate_hits(pos_val_pred, neg_val_pred, pos_test_pred, neg_test_pred, evaluator)
@@ -799,12 +954,14 @@ def run_sweal(args, device):
         }
     if args.calc_ratio:
         rw_kwargs.update({'calc_ratio': True})
+    if args.cache_dynamic_subgraphs:
+        rw_kwargs.update({'cache_subgraphs': True})
 
     if not any([args.train_gae, args.train_mf, args.train_n2v]):
         print("Setting up Train data")
-        dataset_class = 'SEALDynamicDataset' if args.dynamic_train else 'SEALDataset'
+        dataset_class = DATASET_CLS[args.dynamic_train]
         if not args.pairwise:
-            train_dataset = eval(dataset_class)(
+            train_dataset = dataset_class(
                 path,
                 data,
                 split_edge,
@@ -819,10 +976,12 @@ def run_sweal(args, device):
                 rw_kwargs=rw_kwargs,
                 device=device,
                 neg_ratio=args.neg_ratio,
+                extract_workers=args.extract_workers,
+                keep_in_memory=args.keep_in_memory,
             )
         else:
             pos_path = f'{path}_pos_edges'
-            train_positive_dataset = eval(dataset_class)(
+            train_positive_dataset = dataset_class(
                 pos_path,
                 data,
                 split_edge,
@@ -839,9 +998,11 @@ def run_sweal(args, device):
                 pairwise=args.pairwise,
                 pos_pairwise=True,
                 neg_ratio=args.neg_ratio,
+                extract_workers=args.extract_workers,
+                keep_in_memory=args.keep_in_memory,
             )
             neg_path = f'{path}_neg_edges'
-            train_negative_dataset = eval(dataset_class)(
+            train_negative_dataset = dataset_class(
                 neg_path,
                 data,
                 split_edge,
@@ -858,6 +1019,8 @@ def run_sweal(args, device):
                 pairwise=args.pairwise,
                 pos_pairwise=False,
                 neg_ratio=args.neg_ratio,
+                extract_workers=args.extract_workers,
+                keep_in_memory=args.keep_in_memory,
             )
     viz = False
     if viz:  # visualize some graphs
@@ -884,8 +1047,8 @@ def run_sweal(args, device):
 
     if not any([args.train_gae, args.train_mf, args.train_n2v]):
         print("Setting up Val data")
-        dataset_class = 'SEALDynamicDataset' if args.dynamic_val else 'SEALDataset'
-        val_dataset = eval(dataset_class)(
+        dataset_class = DATASET_CLS[args.dynamic_val]
+        val_dataset = dataset_class(
             path,
             data,
             split_edge,
@@ -898,11 +1061,13 @@ def run_sweal(args, device):
             max_nodes_per_hop=args.max_nodes_per_hop,
             directed=directed,
             rw_kwargs=rw_kwargs,
-            device=device
+            device=device,
+            extract_workers=args.extract_workers,
+            keep_in_memory=args.keep_in_memory,
         )
         print("Setting up Test data")
-        dataset_class = 'SEALDynamicDataset' if args.dynamic_test else 'SEALDataset'
-        test_dataset = eval(dataset_class)(
+        dataset_class = DATASET_CLS[args.dynamic_test]
+        test_dataset = dataset_class(
             path,
             data,
             split_edge,
@@ -915,7 +1080,9 @@ def run_sweal(args, device):
             max_nodes_per_hop=args.max_nodes_per_hop,
             directed=directed,
             rw_kwargs=rw_kwargs,
-            device=device
+            device=device,
+            extract_workers=args.extract_workers,
+            keep_in_memory=args.keep_in_memory,
         )
 
     if args.calc_ratio:
@@ -925,19 +1092,38 @@ def run_sweal(args, device):
     max_z = 1000  # set a large max_z so that every z has embeddings to look up
 
     if not any([args.train_gae, args.train_mf, args.train_n2v]):
+        if args.amp_dtype and args.use_feature:
+            # the GNN layers run under autocast in this dtype anyway, storing the node features in it halves their
+            # host memory and H2D traffic; initial_node_features copies them into the model's input buffer
+            datasets = [train_positive_dataset, train_negative_dataset] if args.pairwise else [train_dataset]
+            for dataset_ in datasets + [val_dataset, test_dataset]:
+                dataset_.data.x = dataset_.data.x.to(getattr(torch, args.amp_dtype))
+
+        # pinned batches let CUDAPrefetcher copy them to the GPU asynchronously
+        loader_kwargs = {
+            "num_workers": args.num_workers,
+            "pin_memory": torch.device(device).type == 'cuda',
+        }
+        if args.num_workers > 0:
+            loader_kwargs["prefetch_factor"] = args.prefetch_factor
+            loader_kwargs["worker_init_fn"] = init_loader_worker
+        # the train loader's workers are kept alive between epochs instead of being re-forked (with a copy of the
+        # dataset) every epoch. the val and test loaders only run once per evaluation, persistent workers there would
+        # stay resident for the whole run
+        train_loader_kwargs = dict(loader_kwargs, persistent_workers=args.num_workers > 0)
         if args.pairwise:
-            train_pos_loader = DataLoader(train_positive_dataset, batch_size=args.batch_size,
-                                          shuffle=True, num_workers=args.num_workers)
-            train_neg_loader = DataLoader(train_negative_dataset, batch_size=args.batch_size * args.neg_ratio,
-                                          shuffle=True, num_workers=args.num_workers)
+            # one loader (and one set of workers) yielding (positive batch, negative batch) tuples
+            train_pairwise_loader = torch.utils.data.DataLoader(
+                PairwiseDataset(train_positive_dataset, train_negative_dataset),
+                batch_sampler=PairwiseBatchSampler(len(train_positive_dataset), len(train_negative_dataset),
+                                                   args.batch_size, args.neg_ratio),
+                collate_fn=PairwiseDataset.collate, **train_loader_kwargs)
         else:
             train_loader = DataLoader(train_dataset, batch_size=args.batch_size,
-                                      shuffle=True, num_workers=args.num_workers)
+                                      shuffle=True, **train_loader_kwargs)
 
-        val_loader = DataLoader(val_dataset, batch_size=args.batch_size,
-                                num_workers=args.num_workers)
-        test_loader = DataLoader(test_dataset, batch_size=args.batch_size,
-                                 num_workers=args.num_workers)
+        val_loader = DataLoader(val_dataset, batch_size=args.batch_size, **loader_kwargs)
+        test_loader = DataLoader(test_dataset, batch_size=args.batch_size, **loader_kwargs)
 
     if args.train_node_embedding:
         emb = torch.nn.Embedding(data.num_nodes, args.hidden_channels).to(device)
@@ -948,164 +1134,208 @@ def run_sweal(args, device):
     else:
         emb = None
 
-    seed_everything(args.seed)  # reset rng for model weights
-    for run in range(args.runs):
-        if args.pairwise:
-            train_dataset = train_positive_dataset
-        if args.train_gae:
-            if not args.dataset.startswith('ogbl'):
-                train_gnn(device, data, split_edge, args)
-            else:
-                train_gae_ogbl(args, device, data, split_edge)
-            exit()
-        if args.train_n2v:
-            if not args.dataset.startswith('ogbl'):
-                run_n2v(device, data, split_edge, args.epochs, args.lr, args.hidden_channels, args.neg_ratio,
-                        args.batch_size, args.num_workers, args)
-            else:
-                run_and_save_n2v(args, device, data)  # saves n2v embeddings
-                train_n2v_emb(args, device, data, split_edge)  # trains MLP on above saved n2v embeddings
-            exit()
-        if args.train_mf:
-            if not args.dataset.startswith('ogbl'):
-                train_mf(data, split_edge, device, args.log_steps, args.num_layers, args.hidden_channels, args.dropout,
-                         args.batch_size, args.lr, args.epochs, args.eval_steps, args.runs, args.seed, args)
+    # checkpoints are written by a background thread so the epoch loop does not wait on the disk
+    checkpoint_pool = ThreadPoolExecutor(max_workers=1) if args.checkpoint_training else None
+
+    try:
+        seed_everything(args.seed)  # reset rng for model weights
+        for run in range(args.runs):
+            if args.pairwise:
+                train_dataset = train_positive_dataset
+            if args.train_gae:
+                if not args.dataset.startswith('ogbl'):
+                    train_gnn(device, data, split_edge, args)
+                else:
+                    train_gae_ogbl(args, device, data, split_edge)
+                exit()
+            if args.train_n2v:
+                if not args.dataset.startswith('ogbl'):
+                    run_n2v(device, data, split_edge, args.epochs, args.lr, args.hidden_channels, args.neg_ratio,
+                            args.batch_size, args.num_workers, args)
+                else:
+                    run_and_save_n2v(args, device, data)  # saves n2v embeddings
+                    train_n2v_emb(args, device, data, split_edge)  # trains MLP on above saved n2v embeddings
+                exit()
+            if args.train_mf:
+                if not args.dataset.startswith('ogbl'):
+                    train_mf(data, split_edge, device, args.log_steps, args.num_layers, args.hidden_channels,
+                             args.dropout, args.batch_size, args.lr, args.epochs, args.eval_steps, args.runs, args.seed,
+                             args)
+                else:
+                    train_mf_ogbl(args, split_edge, data)
+                exit()
+            if run == 0:
+                model_kwargs = {
+                    "hidden_channels": args.hidden_channels,
+                    "num_layers": args.num_layers,
+                    "max_z": max_z,
+                    "train_dataset": train_dataset,
+                    "use_feature": args.use_feature,
+                    "node_embedding": emb,
+                }
+                if args.model != 'GIN':
+                    model_kwargs["dropedge"] = args.dropedge
+                k_path = None
+                if args.model == 'DGCNN':
+                    model_kwargs.update({"k": args.sortpool_k, "dynamic_train": args.dynamic_train})
+                    if args.dynamic_train and args.sortpool_k <= 1:
+                        # turning the percentile into k extracts up to 1000 dynamic subgraphs, so the result is stored
+                        # next to the dataset and reused. the file name hashes every setting that changes the sizes
+                        # of those subgraphs, as data_appendix (and so the dataset path) can be set by hand
+                        k_settings = (args.sortpool_k, train_dataset.percent, train_dataset.num_hops,
+                                      train_dataset.ratio_per_hop, train_dataset.max_nodes_per_hop,
+                                      train_dataset.rw_kwargs.get('m'), train_dataset.rw_kwargs.get('M'),
+                                      train_dataset.neg_ratio, train_dataset.directed, args.seed)
+                        k_key = hashlib.sha1(repr(k_settings).encode()).hexdigest()[:16]
+                        k_path = os.path.join(train_dataset.root, f'sortpool_k_{k_key}.pt')
+                        if os.path.exists(k_path):
+                            model_kwargs["k"] = torch.load(k_path)
+                model = MODELS[args.model](**model_kwargs).to(device)
+                if k_path is not None and not os.path.exists(k_path):
+                    torch.save(model.k, k_path)
+                if args.conv_checkpointing:
+                    model.enable_conv_checkpointing()
+                if args.amp_dtype:
+                    model.amp_dtype = getattr(torch, args.amp_dtype)
+                if args.compile:
+                    model.compile_forward()
+                forward_loss = torch.compile(bce_forward_loss, dynamic=True) if args.compile else bce_forward_loss
+                # float16 autocast needs loss scaling to keep small gradients from underflowing, bfloat16 has the range
+                # of float32 and does not. a disabled scaler just calls backward() and optimizer.step()
+                grad_scaler = torch.cuda.amp.GradScaler(enabled=args.amp_dtype == 'float16')
             else:
-                train_mf_ogbl(args, split_edge, data)
-            exit()
-        if args.model == 'DGCNN':
-            model = DGCNN(args.hidden_channels, args.num_layers, max_z, args.sortpool_k,
-                          train_dataset, args.dynamic_train, use_feature=args.use_feature,
-                          node_embedding=emb, dropedge=args.dropedge).to(device)
-        elif args.model == 'SAGE':
-            model = SAGE(args.hidden_channels, args.num_layers, max_z, train_dataset,
-                         args.use_feature, node_embedding=emb, dropedge=args.dropedge).to(device)
-        elif args.model == 'GCN':
-            model = GCN(args.hidden_channels, args.num_layers, max_z, train_dataset,
-                        args.use_feature, node_embedding=emb, dropedge=args.dropedge).to(device)
-        elif args.model == 'GIN':
-            model = GIN(args.hidden_channels, args.num_layers, max_z, train_dataset,
-                        args.use_feature, node_embedding=emb).to(device)
-        parameters = list(model.parameters())
-        if args.train_node_embedding:
-            torch.nn.init.xavier_uniform_(emb.weight)
-            parameters += list(emb.parameters())
-        optimizer = torch.optim.Adam(params=parameters, lr=args.lr)
-        total_params = sum(p.numel() for param in parameters for p in param)
-        print(f'Total number of parameters is {total_params}')
-        if args.model == 'DGCNN':
-            print(f'SortPooling k is set to {model.k}')
-        with open(log_file, 'a') as f:
-            print(f'Total number of parameters is {total_params}', file=f)
+                # the model (including DGCNN's SortPooling k, which scans the train dataset) is built once, later runs
+                # only re-initialize its weights
+                model.reset_parameters()
+            parameters = list(model.parameters())
+            if args.train_node_embedding:
+                torch.nn.init.xavier_uniform_(emb.weight)
+                parameters += list(emb.parameters())
+            optimizer = get_adam(parameters, args.lr)
+            # emb is also registered as a submodule of the model, so its parameters can appear twice in the list
+            total_params = sum(p.numel() for p in dict.fromkeys(parameters))
+            print(f'Total number of parameters is {total_params}')
             if args.model == 'DGCNN':
-                print(f'SortPooling k is set to {model.k}', file=f)
-
-        start_epoch = 1
-        if args.continue_from is not None:
-            model.load_state_dict(
-                torch.load(os.path.join(args.res_dir,
-                                        'run{}_model_checkpoint{}.pth'.format(run + 1, args.continue_from)))
-            )
-            optimizer.load_state_dict(
-                torch.load(os.path.join(args.res_dir,
-                                        'run{}_optimizer_checkpoint{}.pth'.format(run + 1, args.continue_from)))
-            )
-            start_epoch = args.continue_from + 1
-            args.epochs -= args.continue_from
-
-        if args.only_test:
-            results = test(evaluator, model, val_loader, device, emb, test_loader, args)
-            for key, result in results.items():
-                loggers[key].add_result(run, result)
-            for key, result in results.items():
-                valid_res, test_res = result
-                print(key)
-                print(f'Run: {run + 1:02d}, '
-                      f'Valid: {100 * valid_res:.2f}%, '
-                      f'Test: {100 * test_res:.2f}%')
-            pdb.set_trace()
-            exit()
-
-        if args.test_multiple_models:
-            model_paths = [
-            ]  # enter all your pretrained .pth model paths here
-            models = []
-            for path in model_paths:
-                m = cp.deepcopy(model)
-                m.load_state_dict(torch.load(path))
-                models.append(m)
-            Results = test_multiple_models(models, val_loader, device, emb, test_loader, evaluator, args)
-            for i, path in enumerate(model_paths):
-                print(path)
-                with open(log_file, 'a') as f:
-                    print(path, file=f)
-                results = Results[i]
+                print(f'SortPooling k is set to {model.k}')
+            with open(log_file, 'a') as f:
+                print(f'Total number of parameters is {total_params}', file=f)
+                if args.model == 'DGCNN':
+                    print(f'SortPooling k is set to {model.k}', file=f)
+
+            start_epoch = 1
+            if args.continue_from is not None:
+                model.load_state_dict(
+                    torch.load(os.path.join(args.res_dir,
+                                            'run{}_model_checkpoint{}.pth'.format(run + 1, args.continue_from)))
+                )
+                optimizer.load_state_dict(
+                    torch.load(os.path.join(args.res_dir,
+                                            'run{}_optimizer_checkpoint{}.pth'.format(run + 1, args.continue_from)))
+                )
+                start_epoch = args.continue_from + 1
+                args.epochs -= args.continue_from
+
+            if args.only_test:
+                results = test(evaluator, model, val_loader, device, emb, test_loader, args)
                 for key, result in results.items():
                     loggers[key].add_result(run, result)
                 for key, result in results.items():
                     valid_res, test_res = result
-                    to_print = (f'Run: {run + 1:02d}, ' +
-                                f'Valid: {100 * valid_res:.2f}%, ' +
-                                f'Test: {100 * test_res:.2f}%')
                     print(key)
-                    print(to_print)
+                    print(f'Run: {run + 1:02d}, '
+                          f'Valid: {100 * valid_res:.2f}%, '
+                          f'Test: {100 * test_res:.2f}%')
+                pdb.set_trace()
+                exit()
+
+            if args.test_multiple_models:
+                model_paths = [
+                ]  # enter all your pretrained .pth model paths here
+                # load every checkpoint into the one model in turn instead of keeping a deepcopy per path resident
+                Results = []
+                for path in model_paths:
+                    model.load_state_dict(torch.load(path, map_location=device))
+                    Results.append(test(evaluator, model, val_loader, device, emb, test_loader, args))
+                for i, path in enumerate(model_paths):
+                    print(path)
                     with open(log_file, 'a') as f:
-                        print(key, file=f)
-                        print(to_print, file=f)
-            pdb.set_trace()
-            exit()
-
-        # Training starts
-        all_stats = []
-        for epoch in range(start_epoch, start_epoch + args.epochs):
-            if args.profile:
-                # this gives the stats for exactly one training epoch
-                loss, stats = profile_train(model, train_loader, optimizer, device, emb, train_dataset, args)
-                all_stats.append(stats)
-            else:
-                if not args.pairwise:
-                    loss = train_bce(model, train_loader, optimizer, device, emb, train_dataset, args)
-                else:
-                    loss = train_pairwise(model, train_pos_loader, train_neg_loader, optimizer, device, emb,
-                                          train_dataset,
-                                          args)
-
-            if epoch % args.eval_steps == 0:
-                results = test(evaluator, model, val_loader, device, emb, test_loader, args)
-                for key, result in results.items():
-                    loggers[key].add_result(run, result)
-
-                if epoch % args.log_steps == 0:
-                    if args.checkpoint_training:
-                        model_name = os.path.join(
-                            args.res_dir, 'run{}_model_checkpoint{}.pth'.format(run + 1, epoch))
-                        optimizer_name = os.path.join(
-                            args.res_dir, 'run{}_optimizer_checkpoint{}.pth'.format(run + 1, epoch))
-                        torch.save(model.state_dict(), model_name)
-                        torch.save(optimizer.state_dict(), optimizer_name)
-
+                        print(path, file=f)
+                    results = Results[i]
+                    for key, result in results.items():
+                        loggers[key].add_result(run, result)
                     for key, result in results.items():
                         valid_res, test_res = result
-                        to_print = (f'Run: {run + 1:02d}, Epoch: {epoch:02d}, ' +
-                                    f'Loss: {loss:.4f}, Valid: {100 * valid_res:.2f}%, ' +
+                        to_print = (f'Run: {run + 1:02d}, ' +
+                                    f'Valid: {100 * valid_res:.2f}%, ' +
                                     f'Test: {100 * test_res:.2f}%')
                         print(key)
                         print(to_print)
                         with open(log_file, 'a') as f:
                             print(key, file=f)
                             print(to_print, file=f)
+                pdb.set_trace()
+                exit()
+
+            # Training starts
+            all_stats = []
+            for epoch in range(start_epoch, start_epoch + args.epochs):
+                if args.profile:
+                    # this gives the stats for exactly one training epoch
+                    loss, stats = profile_train(model, train_loader, optimizer, device, emb, train_dataset, args,
+                                                forward_loss, grad_scaler)
+                    all_stats.append(stats)
+                else:
+                    if not args.pairwise:
+                        loss = train_bce(model, train_loader, optimizer, device, emb, train_dataset, args, forward_loss,
+                                         grad_scaler)
+                    else:
+                        loss = train_pairwise(model, train_pairwise_loader, optimizer, device, emb,
+                                              train_dataset,
+                                              args, grad_scaler)
+
+                if epoch % args.eval_steps == 0:
+                    results = test(evaluator, model, val_loader, device, emb, test_loader, args)
+                    for key, result in results.items():
+                        loggers[key].add_result(run, result)
+
+                    if epoch % args.log_steps == 0:
+                        if args.checkpoint_training:
+                            model_name = os.path.join(
+                                args.res_dir, 'run{}_model_checkpoint{}.pth'.format(run + 1, epoch))
+                            optimizer_name = os.path.join(
+                                args.res_dir, 'run{}_optimizer_checkpoint{}.pth'.format(run + 1, epoch))
+                            checkpoint_pool.submit(torch.save, state_dict_to_cpu(model.state_dict()), model_name)
+                            checkpoint_pool.submit(torch.save, state_dict_to_cpu(optimizer.state_dict()),
+                                                   optimizer_name)
+
+                        lines = []
+                        for key, result in results.items():
+                            valid_res, test_res = result
+                            to_print = (f'Run: {run + 1:02d}, Epoch: {epoch:02d}, ' +
+                                        f'Loss: {loss:.4f}, Valid: {100 * valid_res:.2f}%, ' +
+                                        f'Test: {100 * test_res:.2f}%')
+                            lines += [key, to_print]
+                        # one open and write of the log file per epoch rather than one per metric
+                        lines = '\n'.join(lines)
+                        print(lines)
+                        with open(log_file, 'a') as f:
+                            print(lines, file=f)
 
-        if args.profile:
-            stats_suffix = f'{args.model}_{args.dataset}{args.data_appendix}_seed_{args.seed}'
-            profile_helper(all_stats, model, train_dataset, stats_suffix)
+            if args.profile:
+                stats_suffix = f'{args.model}_{args.dataset}{args.data_appendix}_seed_{args.seed}'
+                profile_helper(all_stats, model, train_dataset, stats_suffix)
 
-        for key in loggers.keys():
-            print(key)
-            loggers[key].add_info(args.epochs, args.runs)
-            loggers[key].print_statistics(run)
-            with open(log_file, 'a') as f:
-                print(key, file=f)
-                loggers[key].print_statistics(run, f=f)
+            for key in loggers.keys():
+                print(key)
+                loggers[key].add_info(args.epochs, args.runs)
+                loggers[key].print_statistics(run)
+                with open(log_file, 'a') as f:
+                    print(key, file=f)
+                    loggers[key].print_statistics(run, f=f)
+    finally:
+        if checkpoint_pool is not None:
+            # make sure every submitted checkpoint is on disk before run_sweal returns
+            checkpoint_pool.shutdown(wait=True)
 
     for key in loggers.keys():
         print(key)
@@ -1165,8 +1395,16 @@ if __name__ == '__main__':
                         help="dynamically extract enclosing subgraphs on the fly")
     parser.add_argument('--dynamic_val', action='store_true')
     parser.add_argument('--dynamic_test', action='store_true')
+    parser.add_argument('--cache_dynamic_subgraphs', action='store_true',
+                        help="extract the dynamic subgraphs once into a memory-mapped cache and reuse it every epoch")
     parser.add_argument('--num_workers', type=int, default=16,
                         help="number of workers for dynamic mode; 0 if not dynamic")
+    parser.add_argument('--prefetch_factor', type=int, default=2,
+                        help="number of batches loaded in advance by each worker in dynamic mode")
+    parser.add_argument('--extract_workers', type=int, default=1,
+                        help="number of processes used to extract the subgraphs of a non-dynamic dataset")
+    parser.add_argument('--keep_in_memory', action='store_true',
+                        help="keep freshly processed non-dynamic datasets in memory instead of saving them to disk")
     parser.add_argument('--train_node_embedding', action='store_true',
                         help="also train free-parameter node embeddings together with GNN")
     parser.add_argument('--pretrained_node_embedding', type=str, default=None,
@@ -1220,6 +1458,11 @@ if __name__ == '__main__':
 
     parser.add_argument('--train_n2v', action='store_true', help="Train node2vec on the dataset")
     parser.add_argument('--train_mf', action='store_true', help="Train MF on the dataset")
+    parser.add_argument('--conv_checkpointing', action='store_true',
+                        help="Recompute GNN layer activations during backward to reduce peak memory")
+    parser.add_argument('--compile', action='store_true', help="Compile the GNN forward pass with torch.compile")
+    parser.add_argument('--amp_dtype', type=str, default=None, choices=['bfloat16', 'float16'],
+                        help="Run the GNN layers under autocast with the given dtype")
 
     args = parser.parse_args()
 
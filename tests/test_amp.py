@@ -0,0 +1,30 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+models = pytest.importorskip('models')
+from torch_geometric.data import Batch, Data
+
+
+def small_batch():
+    # two enclosing subgraphs, node 0 and 1 of each are the target link
+    graphs = []
+    for num_nodes in [5, 4]:
+        ring = torch.arange(num_nodes)
+        edge_index = torch.stack([ring, ring.roll(1)])
+        edge_index = torch.cat([edge_index, edge_index.flip(0)], 1)
+        z = torch.randint(1, 5, (num_nodes,))
+        graphs.append(Data(z=z, edge_index=edge_index, num_nodes=num_nodes))
+    return Batch.from_data_list(graphs)
+
+
+@pytest.mark.parametrize('model_cls', [models.GCN, models.SAGE, models.DGCNN, models.GIN])
+def test_bfloat16_autocast_forward_backward(model_cls):
+    # what --amp_dtype bfloat16 sets on the model, on the cpu
+    torch.manual_seed(0)
+    model = model_cls(hidden_channels=8, num_layers=2, max_z=10, train_dataset=None)
+    model.amp_dtype = torch.bfloat16
+    data = small_batch()
+    logits = model(data.num_nodes, data.z, data.edge_index, data.batch)
+    assert logits.shape == (data.num_graphs, 1)
+    assert torch.isfinite(logits).all()
+    logits.float().sum().backward()
@@ -0,0 +1,166 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+models = pytest.importorskip('models')
+import torch.nn.functional as F
+from torch.nn import Conv1d, Embedding, Linear, MaxPool1d, ModuleList, ReLU, Sequential, BatchNorm1d as BN
+from torch_geometric.data import Batch, Data
+from torch_geometric.nn import GCNConv, GINConv, MLP, global_mean_pool, global_sort_pool
+
+
+def small_batch(sizes=(5, 4, 7)):
+    # enclosing subgraphs as rings, node 0 and 1 of each are the target link
+    graphs = []
+    for num_nodes in sizes:
+        ring = torch.arange(num_nodes)
+        edge_index = torch.stack([ring, ring.roll(1)])
+        edge_index = torch.cat([edge_index, edge_index.flip(0)], 1)
+        z = torch.randint(1, 5, (num_nodes,))
+        graphs.append(Data(z=z, edge_index=edge_index, num_nodes=num_nodes))
+    return Batch.from_data_list(graphs)
+
+
+def gin_block(in_channels, hidden_channels):
+    return GINConv(Sequential(Linear(in_channels, hidden_channels), ReLU(), Linear(hidden_channels, hidden_channels),
+                              ReLU(), BN(hidden_channels)))
+
+
+class BaselineGIN(torch.nn.Module):
+    # GIN's module layout (and forward) before the rewrites, used to check checkpoint compatibility
+    def __init__(self, hidden_channels, num_layers, max_z):
+        super(BaselineGIN, self).__init__()
+        self.z_embedding = Embedding(max_z, hidden_channels)
+        self.conv1 = gin_block(hidden_channels, hidden_channels)
+        self.convs = torch.nn.ModuleList([gin_block(hidden_channels, hidden_channels) for _ in range(num_layers - 1)])
+        self.mlp = MLP([num_layers * hidden_channels, hidden_channels, 1], dropout=0.5, batch_norm=False)
+
+    def forward(self, z, edge_index, batch):
+        x = self.conv1(self.z_embedding(z), edge_index)
+        xs = [x]
+        for conv in self.convs:
+            x = conv(x, edge_index)
+            xs += [x]
+        return self.mlp(global_mean_pool(torch.cat(xs, dim=1), batch))
+
+
+def test_gin_loads_baseline_state_dict():
+    torch.manual_seed(0)
+    baseline = BaselineGIN(hidden_channels=8, num_layers=3, max_z=10)
+    model = models.GIN(hidden_channels=8, num_layers=3, max_z=10, train_dataset=None)
+    model.load_state_dict(baseline.state_dict())
+
+    data = small_batch()
+    baseline.eval()
+    model.eval()
+    expected = baseline(data.z, data.edge_index, data.batch)
+    out = model(data.num_nodes, data.z, data.edge_index, data.batch)
+    assert torch.allclose(out, expected, atol=1e-5)
+
+
+def test_gin_checkpointing_updates_batchnorm_stats_once():
+    torch.manual_seed(0)
+    model = models.GIN(hidden_channels=8, num_layers=3, max_z=10, train_dataset=None)
+    checkpointed = models.GIN(hidden_channels=8, num_layers=3, max_z=10, train_dataset=None)
+    checkpointed.load_state_dict(model.state_dict())
+    checkpointed.enable_conv_checkpointing()
+
+    data = small_batch()
+    for m in [model, checkpointed]:
+        m.train()
+        torch.manual_seed(1)
+        m(data.num_nodes, data.z, data.edge_index, data.batch).sum().backward()
+
+    buffers = dict(model.named_buffers())
+    for name, buffer in checkpointed.named_buffers():
+        assert torch.allclose(buffer.float(), buffers[name].float(), atol=1e-6), name
+    assert all(b.item() == 1 for name, b in buffers.items() if name.endswith('num_batches_tracked'))
+    for p, p_ckpt in zip(model.parameters(), checkpointed.parameters()):
+        assert torch.allclose(p.grad, p_ckpt.grad, atol=1e-6)
+
+
+def batch_of(sizes):
+    return torch.cat([torch.full((num_nodes,), i, dtype=torch.long) for i, num_nodes in enumerate(sizes)])
+
+
+@pytest.mark.parametrize('k', [3, 6, 10])
+def test_sort_pool_matches_global_sort_pool(k):
+    # graphs both larger and smaller than k, the last one smaller than k for every parametrization
+    torch.manual_seed(0)
+    batch, channels = batch_of((8, 5, 2)), 4
+    x = torch.randn(batch.numel(), channels)
+    assert torch.equal(models.sort_pool(x, batch, k), global_sort_pool(x, batch, k))
+
+
+def test_sort_pool_all_graphs_smaller_than_k():
+    torch.manual_seed(0)
+    batch, channels = batch_of((3, 1, 2)), 5
+    x = torch.randn(batch.numel(), channels)
+    assert torch.equal(models.sort_pool(x, batch, 4), global_sort_pool(x, batch, 4))
+
+
+def test_sort_pool_ties_in_last_channel():
+    torch.manual_seed(0)
+    k = 3
+    batch, channels = batch_of((6, 4)), 3
+    x = torch.randn(batch.numel(), channels)
+    # tied rows straddling the k-th position: identical rows give the same output whichever one is picked
+    x[1:4] = x[0]
+    x[6:8] = x[9]
+    assert torch.equal(models.sort_pool(x, batch, k), global_sort_pool(x, batch, k))
+
+    # rows that only tie on the last channel: the order among them is unspecified, but the selected scores are
+    # the same and every selected row is a row of its graph
+    x = torch.randn(batch.numel(), channels)
+    x[:4, -1] = 1.0
+    out = models.sort_pool(x, batch, k).view(2, k, channels)
+    expected = global_sort_pool(x, batch, k).view(2, k, channels)
+    assert torch.equal(out[..., -1], expected[..., -1])
+    for graph, rows in enumerate(out):
+        graph_x = x[batch == graph]
+        for row in rows:
+            assert (graph_x == row).all(-1).any()
+
+
+class BaselineDGCNN(torch.nn.Module):
+    # DGCNN's module layout (and forward) before its first Conv1d became a matmul, without features or dropedge
+    def __init__(self, hidden_channels, num_layers, max_z, k):
+        super(BaselineDGCNN, self).__init__()
+        self.k = k
+        self.z_embedding = Embedding(max_z, hidden_channels)
+        self.convs = ModuleList([GCNConv(hidden_channels, hidden_channels) for _ in range(num_layers)])
+        self.convs.append(GCNConv(hidden_channels, 1))
+        total_latent_dim = hidden_channels * num_layers + 1
+        self.conv1 = Conv1d(1, 16, total_latent_dim, total_latent_dim)
+        self.maxpool1d = MaxPool1d(2, 2)
+        self.conv2 = Conv1d(16, 32, 5, 1)
+        dense_dim = (int((k - 2) / 2 + 1) - 5 + 1) * 32
+        self.mlp = MLP([dense_dim, 128, 1], dropout=0.5, batch_norm=False)
+
+    def forward(self, z, edge_index, batch):
+        xs = [self.z_embedding(z)]
+        for conv in self.convs:
+            xs += [torch.tanh(conv(xs[-1], edge_index))]
+        x = torch.cat(xs[1:], dim=-1)
+        x = global_sort_pool(x, batch, self.k)
+        x = x.unsqueeze(1)  # [num_graphs, 1, k * hidden]
+        x = F.relu(self.conv1(x))
+        x = self.maxpool1d(x)
+        x = F.relu(self.conv2(x))
+        x = x.view(x.size(0), -1)  # [num_graphs, dense_dim]
+        return self.mlp(x)
+
+
+@pytest.mark.parametrize('k', [10, 13])
+def test_dgcnn_head_matches_baseline_conv1d(k):
+    # graphs smaller and larger than k, so the head sees zero padded and truncated sorted nodes
+    torch.manual_seed(0)
+    baseline = BaselineDGCNN(hidden_channels=8, num_layers=3, max_z=10, k=k)
+    model = models.DGCNN(hidden_channels=8, num_layers=3, max_z=10, k=k)
+    model.load_state_dict(baseline.state_dict())
+
+    data = small_batch(sizes=(5, 12, 16, 7))
+    baseline.eval()
+    model.eval()
+    expected = baseline(data.z, data.edge_index, data.batch)
+    out = model(data.num_nodes, data.z, data.edge_index, data.batch)
+    assert torch.allclose(out, expected, atol=1e-5)
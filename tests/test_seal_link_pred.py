@@ -0,0 +1,74 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+seal_link_pred = pytest.importorskip('seal_link_pred')
+
+
+def ogb_hits(pos_pred, neg_pred, Ks):
+    # hits@K as evaluate_hits computed it before, one Evaluator call per K
+    from ogb.linkproppred import Evaluator
+    evaluator = Evaluator(name='ogbl-collab')
+    hits = {}
+    for K in Ks:
+        evaluator.K = K
+        hits[K] = evaluator.eval({'y_pred_pos': pos_pred, 'y_pred_neg': neg_pred})[f'hits@{K}']
+    return hits
+
+
+@pytest.mark.parametrize('num_neg', [10, 50, 99, 100, 500])
+def test_hits_at_k_matches_ogb_evaluator(num_neg):
+    pytest.importorskip('ogb')
+    torch.manual_seed(0)
+    Ks = [20, 50, 100]
+    # rounded scores, so there are ties between negatives at the K-th position and between positives and it
+    pos_pred = torch.rand(200).mul(20).round()
+    neg_pred = torch.rand(num_neg).mul(20).round()
+    assert seal_link_pred.hits_at_k(pos_pred, neg_pred, Ks) == ogb_hits(pos_pred, neg_pred, Ks)
+
+
+def test_hits_at_k_ties_at_kth_negative():
+    pytest.importorskip('ogb')
+    Ks = [1, 2, 3, 6]
+    neg_pred = torch.tensor([5., 4., 4., 4., 1.])
+    # a positive equal to the K-th negative is not a hit, more K than negatives counts every positive as a hit
+    pos_pred = torch.tensor([4., 4.5, 5., 6.])
+    hits = seal_link_pred.hits_at_k(pos_pred, neg_pred, Ks)
+    assert hits == ogb_hits(pos_pred, neg_pred, Ks)
+    assert hits == {1: 0.25, 2: 0.75, 3: 0.75, 6: 1.}
+
+
+@pytest.mark.parametrize('num_pos,batch_size,neg_ratio', [(10, 4, 1), (12, 4, 1), (10, 3, 2), (7, 8, 3)])
+def test_pairwise_batch_sampler_matches_paired_loaders(num_pos, batch_size, neg_ratio):
+    num_neg = num_pos * neg_ratio
+    sampler = seal_link_pred.PairwiseBatchSampler(num_pos, num_neg, batch_size, neg_ratio)
+    # the separate shuffled positive and negative loaders train_pairwise used to zip together
+    pos_loader = torch.utils.data.DataLoader(range(num_pos), batch_size=batch_size, shuffle=True)
+    neg_loader = torch.utils.data.DataLoader(range(num_neg), batch_size=batch_size * neg_ratio, shuffle=True)
+    old_batches = list(zip(pos_loader, neg_loader))
+
+    batches = list(sampler)
+    assert len(batches) == len(sampler) == len(pos_loader) == len(neg_loader)
+    seen_pos, seen_neg = [], []
+    for batch, (old_pos, old_neg) in zip(batches, old_batches):
+        pos = [idx for is_negative, idx in batch if not is_negative]
+        neg = [idx for is_negative, idx in batch if is_negative]
+        # batch_size positives and neg_ratio times as many negatives, the last batch being the partial rest
+        assert len(pos) == len(old_pos)
+        assert len(neg) == len(old_neg) == len(pos) * neg_ratio
+        seen_pos += pos
+        seen_neg += neg
+    # every link is used exactly once per epoch, including those of the last partial batch
+    assert sorted(seen_pos) == list(range(num_pos))
+    assert sorted(seen_neg) == list(range(num_neg))
+
+
+def test_pairwise_dataset_collate_splits_positives_and_negatives():
+    from torch_geometric.data import Data
+    pos = [Data(z=torch.zeros(n, dtype=torch.long), num_nodes=n) for n in (2, 3)]
+    neg = [Data(z=torch.ones(n, dtype=torch.long), num_nodes=n) for n in (4, 5, 6)]
+    dataset = seal_link_pred.PairwiseDataset(pos, neg)
+    batch = [(0, 1), (1, 0), (1, 2), (0, 0)]
+    pos_data, neg_data = seal_link_pred.PairwiseDataset.collate([dataset[index] for index in batch])
+    assert pos_data.num_graphs == 2 and neg_data.num_graphs == 2
+    assert (pos_data.z == 0).all() and pos_data.num_nodes == 5
+    assert (neg_data.z == 1).all() and neg_data.num_nodes == 10
@@ -0,0 +1,33 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+seal_link_pred = pytest.importorskip('seal_link_pred')
+from torch_geometric.data import Data
+
+
+def small_graph():
+    # two triangles joined by an edge, plus a pendant node
+    edges = [(0, 1), (1, 2), (2, 0), (2, 3), (3, 4), (4, 5), (5, 3), (5, 6)]
+    edge_index = torch.tensor(edges, dtype=torch.long).t()
+    edge_index = torch.cat([edge_index, edge_index.flip(0)], 1)
+    split_edge = {'train': {'edge': torch.tensor([[0, 3]])},
+                  'valid': {'edge': torch.tensor([[0, 3], [1, 4], [2, 6]]),
+                            'edge_neg': torch.tensor([[0, 6], [1, 5]])}}
+    return Data(edge_index=edge_index, num_nodes=7), split_edge
+
+
+@pytest.mark.parametrize('node_label', ['drnl', 'de', 'de+'])
+def test_cached_subgraphs_match_extraction(tmp_path, node_label):
+    data, split_edge = small_graph()
+    dataset = seal_link_pred.SEALDynamicDataset(
+        str(tmp_path), data, split_edge, num_hops=1, split='valid', node_label=node_label,
+        rw_kwargs={'cache_subgraphs': True})
+    assert dataset.cache_dir is not None
+
+    for idx in range(len(dataset)):
+        cached, extracted = dataset.get(idx), dataset.extract_subgraph(idx)
+        assert torch.equal(cached.node_id, extracted.node_id)
+        assert torch.equal(cached.z, extracted.z.to(torch.long))
+        assert torch.equal(cached.edge_index, extracted.edge_index)
+        assert torch.equal(cached.edge_weight, extracted.edge_weight)
+        assert cached.num_nodes == extracted.num_nodes
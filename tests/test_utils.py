@@ -0,0 +1,136 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+utils = pytest.importorskip('utils')
+import numpy as np
+import scipy.sparse as ssp
+from scipy.sparse.csgraph import shortest_path
+
+
+def random_csr(num_nodes, density, rng):
+    A = ssp.random(num_nodes, num_nodes, density=density, format='csr', random_state=rng)
+    A.data = rng.randint(1, 5, A.nnz).astype(np.float64)
+    return A
+
+
+def random_undirected_csr(num_nodes, density, rng):
+    A = ssp.random(num_nodes, num_nodes, density=density, format='csr', random_state=rng)
+    A = ((A + A.T) > 0).astype(np.float64)
+    A.setdiag(0)
+    A.eliminate_zeros()
+    return A.tocsr()
+
+
+def baseline_drnl_node_labeling(adj, src, dst):
+    # drnl_node_labeling before it dropped edges in place of slicing nodes out and re-inserting their distances
+    src, dst = (dst, src) if src > dst else (src, dst)
+
+    idx = list(range(src)) + list(range(src + 1, adj.shape[0]))
+    adj_wo_src = adj[idx, :][:, idx]
+
+    idx = list(range(dst)) + list(range(dst + 1, adj.shape[0]))
+    adj_wo_dst = adj[idx, :][:, idx]
+
+    dist2src = shortest_path(adj_wo_dst, directed=False, unweighted=True, indices=src)
+    dist2src = np.insert(dist2src, dst, 0, axis=0)
+    dist2src = torch.from_numpy(dist2src)
+
+    dist2dst = shortest_path(adj_wo_src, directed=False, unweighted=True, indices=dst - 1)
+    dist2dst = np.insert(dist2dst, src, 0, axis=0)
+    dist2dst = torch.from_numpy(dist2dst)
+
+    dist = dist2src + dist2dst
+    dist_over_2, dist_mod_2 = torch.div(dist, 2, rounding_mode='trunc'), dist % 2
+
+    z = 1 + torch.min(dist2src, dist2dst)
+    z += dist_over_2 * (dist_over_2 + dist_mod_2 - 1)
+    z[src] = 1.
+    z[dst] = 1.
+    z[torch.isnan(z)] = 0.
+
+    return z.to(torch.long)
+
+
+def baseline_ppr(A, edge_index):
+    # PPR before it grouped the links with unique_consecutive, returns the scores in src-sorted link order
+    from fast_pagerank import pagerank_power
+    num_nodes = A.shape[0]
+    src_index, sort_indices = torch.sort(edge_index[0])
+    dst_index = edge_index[1, sort_indices]
+    edge_index = torch.stack([src_index, dst_index])
+    scores = []
+    j = 0
+    for i in range(edge_index.shape[1]):
+        if i < j:
+            continue
+        src = edge_index[0, i]
+        personalize = np.zeros(num_nodes)
+        personalize[src] = 1
+        ppr = pagerank_power(A, p=0.85, personalize=personalize, tol=1e-7)
+        j = i
+        while edge_index[0, j] == src:
+            j += 1
+            if j == edge_index.shape[1]:
+                break
+        all_dst = edge_index[1, i:j]
+        cur_scores = ppr[all_dst]
+        if cur_scores.ndim == 0:
+            cur_scores = np.expand_dims(cur_scores, 0)
+        scores.append(np.array(cur_scores))
+
+    scores = np.concatenate(scores, 0)
+    return torch.FloatTensor(scores), edge_index
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_ppr_matches_baseline(seed):
+    pytest.importorskip('fast_pagerank')
+    rng = np.random.RandomState(seed)
+    A = random_undirected_csr(30, 0.1, rng)
+    # srcs shared by several links (and repeated links), srcs with a single link, and the largest src last so the
+    # last group ends at the end of the links
+    src = np.concatenate([rng.randint(0, 29, 40), [7, 7, 29]])
+    dst = np.concatenate([rng.randint(0, 30, 40), [3, 3, 0]])
+    edge_index = torch.from_numpy(np.stack([src, dst]))
+
+    scores, out_edge_index = utils.PPR(A, edge_index)
+    expected_scores, expected_edge_index = baseline_ppr(A, edge_index)
+    # PPR keeps the passed link order while the baseline returned the links sorted by src
+    assert torch.equal(out_edge_index, edge_index)
+    expected = {tuple(link): score for link, score in zip(expected_edge_index.t().tolist(), expected_scores.tolist())}
+    assert scores.tolist() == [expected[tuple(link)] for link in edge_index.t().tolist()]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_drnl_node_labeling_matches_baseline(seed):
+    rng = np.random.RandomState(seed)
+    # sparse enough to split into components, plus isolated nodes that are unreachable from any src and dst
+    A = ssp.block_diag((random_undirected_csr(22, 0.06, rng), ssp.csr_matrix((3, 3)))).tocsr()
+    rows, cols = A.nonzero()
+    links = [tuple(rng.choice(25, 2, replace=False)) for _ in range(10)]
+    # target links that are edges of the graph, as for positive links, in both orientations
+    links += [(rows[i], cols[i]) for i in rng.choice(rows.size, min(rows.size, 10), replace=False)]
+    for src, dst in links:
+        expected = baseline_drnl_node_labeling(A, src, dst)
+        z = utils.drnl_node_labeling(A, src, dst)
+        assert torch.equal(z, expected), (src, dst)
+        isolated = [node for node in range(22, 25) if node not in (src, dst)]
+        assert (z[isolated] == 0).all()
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_induced_subgraph_matches_fancy_indexing(seed):
+    rng = np.random.RandomState(seed)
+    A = random_csr(30, 0.15, rng)
+    # repeated nodes, like a src == dst link or a walk revisiting a node
+    nodes = rng.randint(0, 30, rng.randint(1, 40))
+    expected = A[nodes, :][:, nodes]
+    subgraph = utils.induced_subgraph(A, nodes)
+    assert subgraph.shape == expected.shape
+    np.testing.assert_array_equal(subgraph.toarray(), expected.toarray())
+
+
+def test_induced_subgraph_src_equals_dst():
+    A = ssp.csr_matrix(np.array([[0, 1, 1], [1, 0, 0], [1, 0, 0]], dtype=np.float64))
+    nodes = [0, 0, 1, 2]
+    np.testing.assert_array_equal(utils.induced_subgraph(A, nodes).toarray(), A[nodes, :][:, nodes].toarray())
@@ -1,7 +1,9 @@
+import bisect
 import json
 import sys
 import math
 import os
+import multiprocessing as mp
 from pprint import pprint
 
 import torch_geometric.utils
@@ -9,10 +11,9 @@ from tqdm import tqdm
 import random
 import numpy as np
 import scipy.sparse as ssp
-from scipy.sparse.csgraph import shortest_path
+from scipy.sparse.csgraph import dijkstra
 import torch
 
-from torch_geometric.loader import DataLoader
 from torch_geometric.data import Data
 from torch_geometric.utils import negative_sampling, add_self_loops, train_test_split_edges, to_networkx, subgraph
 import matplotlib.pyplot as plt
@@ -27,12 +28,79 @@ def neighbors(fringe, A, outgoing=True):
     # If outgoing=True, find neighbors with outgoing edges;
     # otherwise, find neighbors with incoming edges (you should
     # provide a csc matrix in this case).
-    if outgoing:
-        res = set(A[list(fringe)].indices)
-    else:
-        res = set(A[:, list(fringe)].indices)
-
-    return res
+    # The neighbor lists are gathered straight from indptr/indices (rows of a csr, columns of a csc) instead of
+    # slicing out a submatrix, and returned as a sorted array of unique node ids.
+    positions, _ = gather_rows(A, fringe)
+    return np.unique(A.indices[positions])
+
+
+def gather_rows(A, rows):
+    # Positions in A.indices / A.data of all entries of the given rows of a csr matrix (columns of a csc),
+    # in row order, together with the number of entries of each row.
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = A.indptr[rows]
+    lengths = A.indptr[rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(offsets.size), lengths
+
+
+def induced_subgraph(A, nodes):
+    # Same matrix as A[nodes, :][:, nodes] for a csr A, built from the gathered rows only. scipy's column fancy
+    # indexing allocates an array over all N columns of A for every call, which dominates on large graphs.
+    # Repeated entries of nodes (src == dst) are kept like fancy indexing does: a column that appears several
+    # times in nodes becomes one entry for each of its local indices.
+    nodes = np.asarray(nodes, dtype=np.int64)
+    num_nodes = nodes.size
+    positions, lengths = gather_rows(A, nodes)
+    cols = A.indices[positions]
+    sorter = np.argsort(nodes, kind='stable')
+    sorted_nodes = nodes[sorter]
+    first = np.searchsorted(sorted_nodes, cols, side='left')
+    counts = np.searchsorted(sorted_nodes, cols, side='right') - first
+    entries = np.repeat(np.arange(cols.size), counts)
+    repeat = np.arange(entries.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    local = sorter[first[entries] + repeat]
+    rows = np.repeat(np.arange(num_nodes), lengths)[entries]
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=num_nodes), out=indptr[1:])
+    return ssp.csr_matrix((A.data[positions[entries]], local, indptr), shape=(num_nodes, num_nodes))
+
+
+def k_hop_nodes(src, dst, num_hops, A):
+    # Unsampled, undirected k-hop BFS around (src, dst) done on NumPy arrays instead of python sets.
+    # Returns the same nodes and dists as the loop in k_hop_subgraph (up to the order within a hop).
+    visited = np.unique([src, dst])
+    fringe = visited
+    nodes, dists = [np.array([src, dst])], [np.zeros(2, dtype=np.int64)]
+    for dist in range(1, num_hops + 1):
+        fringe = np.setdiff1d(neighbors(fringe, A), visited, assume_unique=True)
+        if fringe.size == 0:
+            break
+        visited = np.union1d(visited, fringe)
+        nodes.append(fringe)
+        dists.append(np.full(fringe.size, dist, dtype=np.int64))
+    return np.concatenate(nodes).tolist(), np.concatenate(dists).tolist()
+
+
+@torch.no_grad()
+def random_walk_unique_nodes(sparse_adj, links, rw_m, rw_M, chunk_size=16384):
+    # Run the rw_M random walks of length rw_m from both ends of every link in a few batched random_walk calls
+    # (one per chunk of links) and dedupe the visited nodes per link on the device.
+    # Returns {(src, dst): sorted list of unique nodes}, the format k_hop_subgraph expects as unique_nodes.
+    device = sparse_adj.device()
+    links = links.t().to(device)
+    unique_nodes = {}
+    for chunk in torch.split(links, chunk_size):
+        # [src, dst] repeated rw_M times per link, same start order as the per-link walks
+        start = chunk.repeat(1, rw_M).flatten()
+        rw = sparse_adj.random_walk(start, rw_m).view(chunk.size(0), -1)
+        rw, _ = rw.sort(dim=1)
+        keep = torch.ones_like(rw, dtype=torch.bool)
+        keep[:, 1:] = rw[:, 1:] != rw[:, :-1]
+        nodes = torch.split(rw[keep].cpu(), keep.sum(dim=1).tolist())
+        for link, link_nodes in zip(chunk.tolist(), nodes):
+            unique_nodes[tuple(link)] = link_nodes.tolist()
+    return unique_nodes
 
 
 def k_hop_subgraph(src, dst, num_hops, A, sample_ratio=1.0,
@@ -41,30 +109,34 @@ def k_hop_subgraph(src, dst, num_hops, A, sample_ratio=1.0,
     debug = False  # set True manually to debug using matplotlib and gephi
     # Extract the k-hop enclosing subgraph around link (src, dst) from A.
     if not rw_kwargs:
-        nodes = [src, dst]
-        dists = [0, 0]
-        visited = set([src, dst])
-        fringe = set([src, dst])
-        for dist in range(1, num_hops + 1):
-            if not directed:
-                fringe = neighbors(fringe, A)
-            else:
-                out_neighbors = neighbors(fringe, A)
-                in_neighbors = neighbors(fringe, A_csc, False)
-                fringe = out_neighbors.union(in_neighbors)
-            fringe = fringe - visited
-            visited = visited.union(fringe)
-            if sample_ratio < 1.0:
-                fringe = random.sample(fringe, int(sample_ratio * len(fringe)))
-            if max_nodes_per_hop is not None:
-                if max_nodes_per_hop < len(fringe):
-                    fringe = random.sample(fringe, max_nodes_per_hop)
-            if len(fringe) == 0:
-                break
-            nodes = nodes + list(fringe)
-            dists = dists + [dist] * len(fringe)
-
-        subgraph = A[nodes, :][:, nodes]
+        if sample_ratio == 1.0 and max_nodes_per_hop is None and not directed:
+            nodes, dists = k_hop_nodes(src, dst, num_hops, A)
+        else:
+            nodes = [src, dst]
+            dists = [0, 0]
+            visited = np.unique([src, dst])
+            fringe = visited
+            for dist in range(1, num_hops + 1):
+                if not directed:
+                    fringe = neighbors(fringe, A)
+                else:
+                    out_neighbors = neighbors(fringe, A)
+                    in_neighbors = neighbors(fringe, A_csc, False)
+                    fringe = np.union1d(out_neighbors, in_neighbors)
+                fringe = np.setdiff1d(fringe, visited, assume_unique=True)
+                visited = np.union1d(visited, fringe)
+                if sample_ratio < 1.0:
+                    fringe = random.sample(fringe.tolist(), int(sample_ratio * len(fringe)))
+                if max_nodes_per_hop is not None:
+                    if max_nodes_per_hop < len(fringe):
+                        fringe = random.sample(list(fringe), max_nodes_per_hop)
+                if len(fringe) == 0:
+                    break
+                fringe = np.asarray(fringe, dtype=np.int64)
+                nodes = nodes + fringe.tolist()
+                dists = dists + [dist] * len(fringe)
+
+        subgraph = induced_subgraph(A, nodes)
 
         # Remove target link between the subgraph.
         subgraph[0, 1] = 0
@@ -78,14 +150,15 @@ def k_hop_subgraph(src, dst, num_hops, A, sample_ratio=1.0,
         # Start of core-logic for S.C.A.L.E.D.
         rw_m = rw_kwargs['rw_m']
         rw_M = rw_kwargs['rw_M']
-        sparse_adj = rw_kwargs['sparse_adj']
         edge_index = rw_kwargs['edge_index']
-        device = rw_kwargs['device']
-        data_org = rw_kwargs['data']
 
         if rw_kwargs.get('unique_nodes'):
             nodes = rw_kwargs.get('unique_nodes')[(src, dst)]
         else:
+            # only walking needs the (possibly cuda) sparse adjacency, extraction workers never get here
+            sparse_adj = rw_kwargs['sparse_adj']
+            device = rw_kwargs['device']
+            data_org = rw_kwargs['data']
             row, col, _ = sparse_adj.csr()
             starting_nodes = torch.tensor([src, dst], dtype=torch.long, device=device)
             start = starting_nodes.repeat(rw_M)
@@ -103,12 +176,13 @@ def k_hop_subgraph(src, dst, num_hops, A, sample_ratio=1.0,
         # subgraph api is same as org_k_hop_subgraph
 
         sub_nodes, sub_edge_index, mapping, _ = org_k_hop_subgraph(rw_set, 0, edge_index, relabel_nodes=True,
-                                                                   num_nodes=data_org.num_nodes)
+                                                                   num_nodes=A.shape[0])
 
-        src_index = rw_set.index(src)
-        dst_index = rw_set.index(dst)
-        mapping_list = mapping.tolist()
-        src, dst = mapping_list[src_index], mapping_list[dst_index]
+        # rw_set is sorted (torch.unique / random_walk_unique_nodes), so bisect instead of a linear list.index scan,
+        # and only the two needed entries of mapping are read back
+        src_index = bisect.bisect_left(rw_set, src)
+        dst_index = bisect.bisect_left(rw_set, dst)
+        src, dst = mapping[src_index].item(), mapping[dst_index].item()
         # Remove target link from the subgraph.
         mask1 = (sub_edge_index[0] != src) | (sub_edge_index[1] != dst)
         mask2 = (sub_edge_index[0] != dst) | (sub_edge_index[1] != src)
@@ -118,77 +192,62 @@ def k_hop_subgraph(src, dst, num_hops, A, sample_ratio=1.0,
         z_revised = py_g_drnl_node_labeling(sub_edge_index_revised, src, dst,
                                             num_nodes=sub_nodes.size(0))
 
-        y = torch.tensor([y], dtype=torch.int)
-        x = data_org.x[sub_nodes] if hasattr(data_org.x, 'size') else None
+        y = torch.tensor([y], dtype=torch.float)
+        x = node_features[sub_nodes] if hasattr(node_features, 'size') else None
+        # rw_set is sorted and unique, so sub_nodes (the sorted unique subset returned above) already is its tensor
         data_revised = Data(x=x, z=z_revised,
-                            edge_index=sub_edge_index_revised, y=y, node_id=torch.LongTensor(rw_set),
-                            num_nodes=len(rw_set), edge_weight=torch.ones(sub_edge_index_revised.shape[-1]))
+                            edge_index=sub_edge_index_revised, y=y, node_id=sub_nodes,
+                            num_nodes=sub_nodes.size(0),
+                            edge_weight=torch.ones(sub_edge_index_revised.size(1), dtype=torch.float))
         # end of core-logic for S.C.A.L.E.D.
         return data_revised
 
 
+def drop_node_edges(adj, node):
+    # Copy of the csr matrix adj without the edges of node. The node itself stays (isolated), so unlike slicing it
+    # out with adj[idx, :][:, idx] the other indices don't shift and only one pass over the nonzeros is needed.
+    rows = np.repeat(np.arange(adj.shape[0]), np.diff(adj.indptr))
+    keep = (rows != node) & (adj.indices != node)
+    indptr = np.zeros(adj.shape[0] + 1, dtype=adj.indptr.dtype)
+    np.cumsum(np.bincount(rows[keep], minlength=adj.shape[0]), out=indptr[1:])
+    return ssp.csr_matrix((adj.data[keep], adj.indices[keep], indptr), shape=adj.shape)
+
+
 def py_g_drnl_node_labeling(edge_index, src, dst, num_nodes=None):
     # adapted from: https://github.com/pyg-team/pytorch_geometric/blob/master/examples/seal_link_pred.py
     # Double-radius node labeling (DRNL).
-    src, dst = (dst, src) if src > dst else (src, dst)
+    # same labeling as drnl_node_labeling once the subgraph is a csr matrix, so the NumPy version is reused
     adj = to_scipy_sparse_matrix(edge_index, num_nodes=num_nodes).tocsr()
-
-    idx = list(range(src)) + list(range(src + 1, adj.shape[0]))
-    adj_wo_src = adj[idx, :][:, idx]
-
-    idx = list(range(dst)) + list(range(dst + 1, adj.shape[0]))
-    adj_wo_dst = adj[idx, :][:, idx]
-
-    dist2src = shortest_path(adj_wo_dst, directed=False, unweighted=True,
-                             indices=src)
-    dist2src = np.insert(dist2src, dst, 0, axis=0)
-    dist2src = torch.from_numpy(dist2src)
-
-    dist2dst = shortest_path(adj_wo_src, directed=False, unweighted=True,
-                             indices=dst - 1)
-    dist2dst = np.insert(dist2dst, src, 0, axis=0)
-    dist2dst = torch.from_numpy(dist2dst)
-
-    dist = dist2src + dist2dst
-    dist_over_2, dist_mod_2 = torch.div(dist, 2, rounding_mode='trunc'), dist % 2
-
-    z = 1 + torch.min(dist2src, dist2dst)
-    z += dist_over_2 * (dist_over_2 + dist_mod_2 - 1)
-    z[src] = 1.
-    z[dst] = 1.
-    z[torch.isnan(z)] = 0.
-
-    return z.to(torch.long)
+    return drnl_node_labeling(adj, src, dst)
 
 
 def drnl_node_labeling(adj, src, dst):
     # Double Radius Node Labeling (DRNL).
     src, dst = (dst, src) if src > dst else (src, dst)
 
-    idx = list(range(src)) + list(range(src + 1, adj.shape[0]))
-    adj_wo_src = adj[idx, :][:, idx]
+    adj_wo_src = drop_node_edges(adj, src)
+    adj_wo_dst = drop_node_edges(adj, dst)
 
-    idx = list(range(dst)) + list(range(dst + 1, adj.shape[0]))
-    adj_wo_dst = adj[idx, :][:, idx]
-
-    dist2src = shortest_path(adj_wo_dst, directed=False, unweighted=True, indices=src)
-    dist2src = np.insert(dist2src, dst, 0, axis=0)
-    dist2src = torch.from_numpy(dist2src)
+    # dijkstra directly: shortest_path's 'auto' picks Floyd-Warshall (all pairs) for the small, dense subgraphs
+    dist2src = dijkstra(adj_wo_dst, directed=False, unweighted=True, indices=src)
+    dist2src[dst] = 0
 
-    dist2dst = shortest_path(adj_wo_src, directed=False, unweighted=True, indices=dst - 1)
-    dist2dst = np.insert(dist2dst, src, 0, axis=0)
-    dist2dst = torch.from_numpy(dist2dst)
+    dist2dst = dijkstra(adj_wo_src, directed=False, unweighted=True, indices=dst)
+    dist2dst[src] = 0
 
-    dist = dist2src + dist2dst
-    dist_over_2, dist_mod_2 = torch.div(dist, 2, rounding_mode='trunc'), dist % 2
+    # the label arithmetic is done in NumPy, the distances are only converted to a tensor once at the end.
+    # unreachable nodes have inf distance, which ends up as nan (and then label 0) just like before
+    with np.errstate(invalid='ignore'):
+        dist = dist2src + dist2dst
+        dist_over_2, dist_mod_2 = np.trunc(dist / 2), dist % 2
 
-    z = 1 + torch.min(dist2src, dist2dst)
-    z += dist_over_2 * (dist_over_2 + dist_mod_2 - 1)
+        z = 1 + np.minimum(dist2src, dist2dst)
+        z += dist_over_2 * (dist_over_2 + dist_mod_2 - 1)
     z[src] = 1.
     z[dst] = 1.
-    z[torch.isnan(z)] = 0.
+    z[np.isnan(z)] = 0.
 
-    return z.to(torch.long)
+    return torch.from_numpy(z.astype(np.int64))
 
 
 def de_node_labeling(adj, src, dst, max_dist=3):
@@ -196,7 +255,7 @@ def de_node_labeling(adj, src, dst, max_dist=3):
     # Powerful Neural Networks for Graph Representation Learning."
     src, dst = (dst, src) if src > dst else (src, dst)
 
-    dist = shortest_path(adj, directed=False, unweighted=True, indices=[src, dst])
+    dist = dijkstra(adj, directed=False, unweighted=True, indices=[src, dst])
     dist = torch.from_numpy(dist)
 
     dist[dist > max_dist] = max_dist
@@ -210,18 +269,15 @@ def de_plus_node_labeling(adj, src, dst, max_dist=100):
     # when computing distance to dst, temporarily mask src. Essentially the same as DRNL.
     src, dst = (dst, src) if src > dst else (src, dst)
 
-    idx = list(range(src)) + list(range(src + 1, adj.shape[0]))
-    adj_wo_src = adj[idx, :][:, idx]
-
-    idx = list(range(dst)) + list(range(dst + 1, adj.shape[0]))
-    adj_wo_dst = adj[idx, :][:, idx]
+    adj_wo_src = drop_node_edges(adj, src)
+    adj_wo_dst = drop_node_edges(adj, dst)
 
-    dist2src = shortest_path(adj_wo_dst, directed=False, unweighted=True, indices=src)
-    dist2src = np.insert(dist2src, dst, 0, axis=0)
+    dist2src = dijkstra(adj_wo_dst, directed=False, unweighted=True, indices=src)
+    dist2src[dst] = 0
     dist2src = torch.from_numpy(dist2src)
 
-    dist2dst = shortest_path(adj_wo_src, directed=False, unweighted=True, indices=dst - 1)
-    dist2dst = np.insert(dist2dst, src, 0, axis=0)
+    dist2dst = dijkstra(adj_wo_src, directed=False, unweighted=True, indices=dst)
+    dist2dst[src] = 0
     dist2dst = torch.from_numpy(dist2dst)
 
     dist = torch.cat([dist2src.view(-1, 1), dist2dst.view(-1, 1)], 1)
@@ -241,7 +297,7 @@ def construct_pyg_graph(node_ids, adj, dists, node_features, y, node_label='drnl
     r = torch.LongTensor(r)
     edge_index = torch.stack([u, v], 0)
     edge_weight = r.to(torch.float)
-    y = torch.tensor([y])
+    y = torch.tensor([y], dtype=torch.float)
     if node_label == 'drnl':  # DRNL
         z = drnl_node_labeling(adj, 0, 1)
     elif node_label == 'hop':  # mininum distance to src and dst
@@ -299,18 +355,12 @@ def calc_ratio_helper(link_index_pos, link_index_neg, A, x, y, num_hops, node_la
     # calculate sparsity of subgraphs of seal vs sweal for the split
     stats_dict = {}
 
-    overall_seal_node_storage = []
-    overall_sweal_node_storage = []
-
-    overall_seal_edge_storage = []
-    overall_sweal_edge_storage = []
-
     if seed == 1:
-        overall_average_seal_node_storage = np.array([], dtype=np.float)
-        overall_average_sweal_node_storage = np.array([], dtype=np.float)
+        overall_average_seal_node_storage = np.array([], dtype=np.float64)
+        overall_average_sweal_node_storage = np.array([], dtype=np.float64)
 
-        overall_average_seal_edge_storage = np.array([], dtype=np.float)
-        overall_average_sweal_edge_storage = np.array([], dtype=np.float)
+        overall_average_seal_edge_storage = np.array([], dtype=np.float64)
+        overall_average_sweal_edge_storage = np.array([], dtype=np.float64)
 
     else:
         saved_npz = np.load(f'saved_calc_ratio{dataset_name}.npz')
@@ -322,16 +372,28 @@ def calc_ratio_helper(link_index_pos, link_index_neg, A, x, y, num_hops, node_la
         overall_average_sweal_edge_storage = saved_npz['overall_average_sweal_edge_storage']
 
     link_index = torch.cat((link_index_pos, link_index_neg), dim=-1)
+    if rw_kwargs.get('rw_M'):
+        # walk all links in batched calls up front, like SEALDataset.process does for the extraction itself
+        rw_kwargs = dict(rw_kwargs, unique_nodes=random_walk_unique_nodes(
+            rw_kwargs['sparse_adj'], link_index, rw_kwargs['rw_m'], rw_kwargs['rw_M']))
+
+    # preallocated, np.append would copy the whole array again for every link
+    num_links = link_index.size(1)
+    overall_seal_node_storage = np.empty(num_links, dtype=np.float64)
+    overall_sweal_node_storage = np.empty(num_links, dtype=np.float64)
 
-    for src, dst in tqdm(link_index.t().tolist()):
+    overall_seal_edge_storage = np.empty(num_links, dtype=np.float64)
+    overall_sweal_edge_storage = np.empty(num_links, dtype=np.float64)
+
+    for i, (src, dst) in enumerate(tqdm(link_index.t().tolist())):
         node_ratio, edge_ratio, num_nodes_seal, num_nodes_sweal, num_edges_seal, num_edges_sweal = calc_node_edge_ratio(
             src, dst, num_hops, A, ratio_per_hop, max_nodes_per_hop, x, y, directed, A_csc, node_label, rw_kwargs)
 
-        overall_seal_node_storage = np.append(overall_seal_node_storage, num_nodes_seal)
-        overall_sweal_node_storage = np.append(overall_sweal_node_storage, num_nodes_sweal)
+        overall_seal_node_storage[i] = num_nodes_seal
+        overall_sweal_node_storage[i] = num_nodes_sweal
 
-        overall_seal_edge_storage = np.append(overall_seal_edge_storage, num_edges_seal)
-        overall_sweal_edge_storage = np.append(overall_sweal_edge_storage, num_edges_sweal)
+        overall_seal_edge_storage[i] = num_edges_seal
+        overall_sweal_edge_storage[i] = num_edges_sweal
 
     overall_average_seal_node_storage = np.append(overall_average_seal_node_storage, overall_seal_node_storage.mean())
     overall_average_sweal_node_storage = np.append(overall_average_sweal_node_storage, overall_sweal_node_storage.mean()
@@ -371,13 +433,63 @@ def calc_ratio_helper(link_index_pos, link_index_neg, A, x, y, num_hops, node_la
         os.remove(f'saved_calc_ratio{dataset_name}.npz')
 
 
+_extract_args = None
+
+
+def _init_extract_worker(extract_args):
+    global _extract_args
+    _extract_args = extract_args
+    torch.set_num_threads(1)
+
+
+def _extract_link(link):
+    src, dst, y = link
+    A, x, num_hops, node_label, directed, A_csc, rw_kwargs = _extract_args
+    if rw_kwargs['rw_m']:
+        data = k_hop_subgraph(src, dst, num_hops, A, node_features=x, y=y, directed=directed, A_csc=A_csc,
+                              rw_kwargs=rw_kwargs)
+    else:
+        tmp = k_hop_subgraph(src, dst, num_hops, A, node_features=x, y=y, directed=directed, A_csc=A_csc)
+        data = construct_pyg_graph(*tmp, node_label)
+    # sent back as numpy arrays: torch's pickling reducers would put every tensor storage of every Data into its
+    # own shared memory segment (one fd/mmap each), which runs out of file descriptors on large splits
+    return {key: value.numpy() if torch.is_tensor(value) else value for key, value in data}
+
+
+def _data_from_numpy(arrays):
+    return Data(**{key: torch.from_numpy(value) if isinstance(value, np.ndarray) else value
+                   for key, value in arrays.items()})
+
+
 def extract_enclosing_subgraphs(link_index, A, x, y, num_hops, node_label='drnl',
                                 ratio_per_hop=1.0, max_nodes_per_hop=None,
-                                directed=False, A_csc=None, rw_kwargs=None):
+                                directed=False, A_csc=None, rw_kwargs=None, num_workers=1):
     # Extract enclosing subgraphs from A for all links in link_index.
+    # y is either one label for all links or a tensor with a label per link.
     data_list = []
 
-    for src, dst in tqdm(link_index.t().tolist()):
+    links = link_index.t().tolist()
+    ys = y.tolist() if torch.is_tensor(y) else [y] * len(links)
+    if rw_kwargs['rw_m']:
+        # with the walks precomputed the remaining per-link work (induced subgraph + DRNL) only touches cpu tensors
+        deterministic = bool(rw_kwargs.get('unique_nodes'))
+    else:
+        deterministic = ratio_per_hop == 1.0 and max_nodes_per_hop is None
+    if num_workers > 1 and deterministic:
+        # deterministic extraction is split across forked workers which see A, x and the walks
+        # copy-on-write instead of receiving a pickled copy. the walks are already drawn, so the workers only get
+        # cpu objects: the (possibly cuda) sparse_adj and device must not be touched in a process forked after cuda
+        # was initialized
+        worker_rw_kwargs = {'rw_m': rw_kwargs['rw_m'], 'rw_M': rw_kwargs['rw_M'],
+                            'unique_nodes': rw_kwargs.get('unique_nodes'),
+                            'edge_index': rw_kwargs['edge_index'].cpu() if rw_kwargs['rw_m'] else None}
+        extract_args = (A, x, num_hops, node_label, directed, A_csc, worker_rw_kwargs)
+        with mp.get_context('fork').Pool(num_workers, _init_extract_worker, (extract_args,)) as pool:
+            jobs = [(src, dst, y) for (src, dst), y in zip(links, ys)]
+            return [_data_from_numpy(arrays)
+                    for arrays in tqdm(pool.imap(_extract_link, jobs, chunksize=256), total=len(jobs))]
+
+    for (src, dst), y in tqdm(zip(links, ys), total=len(ys)):
         if not rw_kwargs['rw_m']:
             tmp = k_hop_subgraph(src, dst, num_hops, A, ratio_per_hop,
                                  max_nodes_per_hop, node_features=x, y=y,
@@ -501,11 +613,12 @@ def get_pos_neg_edges(split, split_edge, edge_index, num_nodes, percent=100, neg
 
 def CN(A, edge_index, batch_size=100000):
     # The Common Neighbor heuristic score.
-    link_loader = DataLoader(range(edge_index.size(1)), batch_size)
+    # batches are plain slices of one NumPy copy of edge_index, no DataLoader collation or per-batch tensor indexing
+    links = edge_index.numpy()
     scores = []
-    for ind in tqdm(link_loader):
-        src, dst = edge_index[0, ind], edge_index[1, ind]
-        cur_scores = np.array(np.sum(A[src].multiply(A[dst]), 1)).flatten()
+    for start in tqdm(range(0, links.shape[1], batch_size)):
+        src, dst = links[:, start:start + batch_size]
+        cur_scores = np.asarray(A[src].multiply(A[dst]).sum(axis=1)).ravel()
         scores.append(cur_scores)
     return torch.FloatTensor(np.concatenate(scores, 0)), edge_index
 
@@ -515,11 +628,11 @@ def AA(A, edge_index, batch_size=100000):
     multiplier = 1 / np.log(A.sum(axis=0))
     multiplier[np.isinf(multiplier)] = 0
     A_ = A.multiply(multiplier).tocsr()
-    link_loader = DataLoader(range(edge_index.size(1)), batch_size)
+    links = edge_index.numpy()
     scores = []
-    for ind in tqdm(link_loader):
-        src, dst = edge_index[0, ind], edge_index[1, ind]
-        cur_scores = np.array(np.sum(A[src].multiply(A_[dst]), 1)).flatten()
+    for start in tqdm(range(0, links.shape[1], batch_size)):
+        src, dst = links[:, start:start + batch_size]
+        cur_scores = np.asarray(A[src].multiply(A_[dst]).sum(axis=1)).ravel()
         scores.append(cur_scores)
     scores = np.concatenate(scores, 0)
     return torch.FloatTensor(scores), edge_index
@@ -529,35 +642,75 @@ def PPR(A, edge_index):
     # The Personalized PageRank heuristic score.
     # Need install fast_pagerank by "pip install fast-pagerank"
     # Too slow for large datasets now.
+    # The scores are returned in the order of the passed edge_index.
     from fast_pagerank import pagerank_power
     num_nodes = A.shape[0]
+    org_edge_index = edge_index
     src_index, sort_indices = torch.sort(edge_index[0])
-    dst_index = edge_index[1, sort_indices]
-    edge_index = torch.stack([src_index, dst_index])
-    # edge_index = edge_index[:, :50]
+    dst_index = edge_index[1, sort_indices].numpy()
+    # one pagerank per distinct src, the group sizes come from unique_consecutive instead of a python scan over
+    # the sorted links (run_sweal passes all splits in one call, so a src shared across splits is also only run once)
+    srcs, counts = torch.unique_consecutive(src_index, return_counts=True)
     scores = []
-    visited = set([])
-    j = 0
-    for i in tqdm(range(edge_index.shape[1])):
-        if i < j:
-            continue
-        src = edge_index[0, i]
+    start = 0
+    for src, count in tqdm(zip(srcs.tolist(), counts.tolist()), total=srcs.size(0)):
         personalize = np.zeros(num_nodes)
         personalize[src] = 1
         ppr = pagerank_power(A, p=0.85, personalize=personalize, tol=1e-7)
-        j = i
-        while edge_index[0, j] == src:
-            j += 1
-            if j == edge_index.shape[1]:
-                break
-        all_dst = edge_index[1, i:j]
-        cur_scores = ppr[all_dst]
-        if cur_scores.ndim == 0:
-            cur_scores = np.expand_dims(cur_scores, 0)
-        scores.append(np.array(cur_scores))
-
-    scores = np.concatenate(scores, 0)
-    return torch.FloatTensor(scores), edge_index
+        scores.append(ppr[dst_index[start:start + count]])
+        start += count
+
+    scores = torch.FloatTensor(np.concatenate(scores, 0))
+    org_scores = torch.empty_like(scores)
+    org_scores[sort_indices] = scores
+    return org_scores, org_edge_index
+
+
+class CUDAPrefetcher(object):
+    # Wraps a DataLoader and copies the next batch to the GPU on a side stream while the current batch is being
+    # consumed, so that host to device transfers overlap with compute (needs pin_memory=True on the loader).
+    # Falls back to a plain synchronous .to(device) when device is not a CUDA device.
+    # The loader can yield single batches or tuples of batches (as the pairwise loader does; pin_memory turns
+    # those tuples into lists).
+    def __init__(self, loader, device):
+        self.loader = loader
+        self.device = torch.device(device)
+        self.stream = torch.cuda.Stream(device=self.device) if self.device.type == 'cuda' else None
+
+    def __len__(self):
+        return len(self.loader)
+
+    @staticmethod
+    def to(data, device, non_blocking=False):
+        if isinstance(data, (tuple, list)):
+            return tuple(batch.to(device, non_blocking=non_blocking) for batch in data)
+        return data.to(device, non_blocking=non_blocking)
+
+    def preload(self, loader_iter):
+        try:
+            data = next(loader_iter)
+        except StopIteration:
+            return None
+        with torch.cuda.stream(self.stream):
+            return self.to(data, self.device, non_blocking=True)
+
+    def __iter__(self):
+        loader_iter = iter(self.loader)
+        if self.stream is None:
+            for data in loader_iter:
+                yield self.to(data, self.device)
+            return
+
+        next_data = self.preload(loader_iter)
+        while next_data is not None:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_stream(self.stream)
+            data = next_data
+            # memory of data was allocated on the side stream, make sure it is not reused while still in use here
+            for batch in data if isinstance(data, tuple) else (data,):
+                batch.record_stream(current_stream)
+            next_data = self.preload(loader_iter)
+            yield data
 
 
 class Logger(object):